@@ -0,0 +1,231 @@
+"""
+Bulk attendance import of badge reader dumps (CSV or NDJSON), collapsed to first-in/last-out per user and day.
+
+    python attendance_import.py punches.csv [--format csv|ndjson] [--batch-size N]
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import case, select
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import Session
+
+import crud
+import database
+import models
+
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+# SQLite's default SQLITE_MAX_VARIABLE_NUMBER; each upserted row binds 4 parameters.
+SQLITE_MAX_VARIABLES = 32766
+UPSERT_CHUNK_ROWS = SQLITE_MAX_VARIABLES // 4
+
+
+def text_stream(binary):
+    """Decodes a binary upload as UTF-8; bad bytes are kept as surrogates so the line can be rejected on its own."""
+    return io.TextIOWrapper(binary, encoding="utf-8", errors="surrogateescape", newline="")
+
+
+def _check_utf8(text: str):
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        raise ValueError("line is not valid UTF-8")
+
+
+def _parse_punch(user_id, timestamp):
+    if user_id in (None, "") or timestamp in (None, ""):
+        raise ValueError("user_id and timestamp are required")
+    value = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        # Attendance is stored in naive server-local time, like check-ins.
+        value = value.astimezone().replace(tzinfo=None)
+    return int(user_id), value
+
+
+def parse_csv(stream):
+    """Yields (line_no, user_id, timestamp) or (line_no, None, error message)."""
+    consumed = [0]
+
+    def lines():
+        for line in stream:
+            consumed[0] += 1
+            yield line
+
+    reader = csv.DictReader(lines())
+    while True:
+        seen = consumed[0]
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            yield consumed[0], None, f"malformed CSV: {exc}"
+            if consumed[0] == seen:
+                return
+            continue
+        try:
+            _check_utf8("".join(str(v) for v in row.values()))
+            yield (reader.line_num, *_parse_punch(row.get("user_id"), row.get("timestamp")))
+        except (TypeError, ValueError) as exc:
+            yield reader.line_num, None, str(exc)
+
+
+def parse_ndjson(stream):
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            _check_utf8(line)
+            record = json.loads(line)
+            yield (line_no, *_parse_punch(record.get("user_id"), record.get("timestamp")))
+        except (AttributeError, TypeError, ValueError) as exc:
+            yield line_no, None, str(exc)
+
+
+PARSERS = {"csv": parse_csv, "ndjson": parse_ndjson}
+
+
+def _earliest(a, b):
+    return case((a.is_(None), b), (b.is_(None), a), (b < a, b), else_=a)
+
+
+def _latest(a, b):
+    return case((a.is_(None), b), (b.is_(None), a), (b > a, b), else_=a)
+
+
+def _upsert_statement(db: Session, rows):
+    stmt = crud.dialect_insert(db, models.Attendance).values(rows)
+    current, incoming = models.Attendance.__table__.c, stmt.excluded
+    first_in = _earliest(current.check_in, incoming.check_in)
+    last_punch = _latest(_latest(current.check_in, current.check_out), _latest(incoming.check_in, incoming.check_out))
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "date"],
+        set_={
+            "check_in": first_in,
+            # A single punch for the day has no check-out.
+            "check_out": case((last_punch == first_in, None), else_=last_punch),
+        },
+    )
+
+
+class AttendanceImporter:
+    def __init__(self, db: Session, batch_size: int = IMPORT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.rows_read = 0
+        self.punches_accepted = 0
+        self.attendance_rows_upserted = 0
+        self.errors = []
+        self.error_count = 0
+        self._pending = {}
+
+    def _error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def add(self, line_no, user_id, value):
+        self.rows_read += 1
+        if user_id is None:
+            self._error(line_no, value)
+            return
+        key = (user_id, value.date())
+        first, last, lines = self._pending.get(key, (value, value, []))
+        lines.append(line_no)
+        self._pending[key] = (min(first, value), max(last, value), lines)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        user_ids = {user_id for user_id, _ in pending}
+        known = set(self.db.scalars(select(models.User.id).where(models.User.id.in_(user_ids))))
+
+        rows, accepted_lines, months = [], [], set()
+        for (user_id, day), (first, last, lines) in pending.items():
+            if user_id not in known:
+                for line_no in lines:
+                    self._error(line_no, f"unknown user_id {user_id}")
+                continue
+            rows.append({
+                "user_id": user_id,
+                "date": day,
+                "check_in": first,
+                "check_out": last if last != first else None,
+            })
+            accepted_lines.extend(lines)
+            months.add((user_id, day.year, day.month))
+        if not rows:
+            return
+
+        try:
+            for offset in range(0, len(rows), UPSERT_CHUNK_ROWS):
+                self.db.execute(_upsert_statement(self.db, rows[offset:offset + UPSERT_CHUNK_ROWS]))
+            # Merged punches may or may not add days, so the touched months are recounted rather than bumped.
+            crud.refresh_rollups(self.db, months)
+            self.db.commit()
+        except DatabaseError as exc:
+            self.db.rollback()
+            for line_no in accepted_lines:
+                self._error(line_no, f"batch write failed: {exc.orig}")
+            return
+        self.punches_accepted += len(accepted_lines)
+        self.attendance_rows_upserted += len(rows)
+
+    def run(self, punches):
+        started = time.perf_counter()
+        for punch in punches:
+            self.add(*punch)
+        self.flush()
+        elapsed = time.perf_counter() - started
+        return {
+            "rows_read": self.rows_read,
+            "punches_accepted": self.punches_accepted,
+            "rows_rejected": self.error_count,
+            "attendance_rows_upserted": self.attendance_rows_upserted,
+            "elapsed_seconds": round(elapsed, 4),
+            "rows_per_second": round(self.rows_read / elapsed, 2) if elapsed > 0 else 0.0,
+            "errors": sorted(self.errors, key=lambda e: e["line"]),
+        }
+
+
+def import_stream(db: Session, stream, fmt: str = "csv", batch_size: int = IMPORT_BATCH_SIZE):
+    if fmt not in PARSERS:
+        raise ValueError(f"unsupported format {fmt!r}, expected one of {sorted(PARSERS)}")
+    return AttendanceImporter(db, batch_size).run(PARSERS[fmt](stream))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import badge reader punches into attendance.")
+    parser.add_argument("path", help="CSV or NDJSON file, '-' for stdin")
+    parser.add_argument("--format", choices=sorted(PARSERS))
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    stream = text_stream(sys.stdin.buffer if args.path == "-" else open(args.path, "rb"))
+    db = database.SessionLocal()
+    try:
+        with stream:
+            result = import_stream(db, stream, fmt, args.batch_size)
+    finally:
+        db.close()
+
+    errors = result.pop("errors")
+    print(json.dumps(result, indent=2))
+    for error in errors:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    return 1 if result["rows_rejected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,22 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, object_session, selectinload
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
+from collections import OrderedDict
+import os
+import threading
+import time
 import uuid
-from typing import Optional, List
+from typing import Dict, Optional, List, Set
 
-from database import get_db
-from models import User
+from database import get_async_db
+from models import EmployeeDB, User
+import hashing
+import instrumentation
 
 
 SECRET_KEY = "supersecretjwtkey"
@@ -16,15 +24,18 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 5
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 RESET_TOKEN_EXPIRE_MINUTES = 15
+PRINCIPAL_CACHE_SIZE = 10000
+USER_MASK_CACHE_SIZE = 10000
+# invalidate_user() only reaches the worker that ran it; other workers pick up a role change
+# once their cached principals and masks (and the role claims of older tokens) age past this.
+ROLE_CACHE_TTL = float(os.getenv("ROLE_CACHE_TTL", "30"))
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = hashing.configured_bcrypt_rounds()
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 
-blacklisted_refresh_tokens = set()
-
-
 ROLE_HIERARCHY = {
     "admin": ["admin", "manager", "hr", "employee"],
     "manager": ["manager", "hr", "employee"],
@@ -32,12 +43,74 @@ ROLE_HIERARCHY = {
     "employee": ["employee"]
 }
 
+# Roles allowed to perform (resource, action) through authorize(); anything not listed is admin-only.
+RESOURCE_POLICY = {
+    ("employee", "create"): ["admin"],
+    ("employee", "view"): ["admin"],
+}
+
+
+class RoleMasks:
+    """ROLE_HIERARCHY as integer bitmasks: a caller is allowed when caller mask & required mask is non-zero."""
+
+    def __init__(self, hierarchy: Dict[str, List[str]]):
+        self._lock = threading.Lock()
+        self.compile(hierarchy)
+
+    def compile(self, hierarchy: Dict[str, List[str]]):
+        with self._lock:
+            self._bits: Dict[str, int] = {}
+            for role, expanded in hierarchy.items():
+                for name in [role, *expanded]:
+                    self._bit(name)
+            self._masks = {
+                role: self._mask_of(expanded) for role, expanded in hierarchy.items()
+            }
+
+    def _bit(self, name: str) -> int:
+        bit = self._bits.get(name)
+        if bit is None:
+            bit = self._bits[name] = 1 << len(self._bits)
+        return bit
+
+    def _mask_of(self, names) -> int:
+        mask = 0
+        for name in names:
+            mask |= self._bit(name)
+        return mask
+
+    def required(self, allowed_roles) -> int:
+        """Mask a caller needs to intersect; computed once per require_roles() dependency."""
+        with self._lock:
+            return self._mask_of(r.lower() for r in allowed_roles)
+
+    def granted(self, role_names) -> int:
+        """Mask of everything the given roles expand to."""
+        mask = 0
+        for name in role_names:
+            name = name.lower()
+            granted = self._masks.get(name)
+            if granted is None:
+                with self._lock:
+                    granted = self._bit(name)
+            mask |= granted
+        return mask
+
+
+role_masks = RoleMasks(ROLE_HIERARCHY)
+POLICY_MASKS = {key: role_masks.required(roles) for key, roles in RESOURCE_POLICY.items()}
+ADMIN_MASK = role_masks.required(["admin"])
+
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    return hashing.executor.run(pwd_context.verify, plain, hashed)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hashing.executor.run(pwd_context.hash, password)
+
+def password_needs_rehash(hashed: str) -> bool:
+    """True when the stored hash was made with another scheme or bcrypt cost than BCRYPT_ROUNDS."""
+    return pwd_context.needs_update(hashed)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -58,9 +131,160 @@ def create_reset_token(data: dict, expires_delta: timedelta = None):
 
 
 def get_user(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+    """The user with their roles in a single SELECT."""
+    return db.query(User).options(joinedload(User.roles)).filter(User.username == username).first()
+
+async def async_get_user(db: AsyncSession, username: str):
+    result = await db.execute(
+        select(User).options(selectinload(User.roles)).where(User.username == username)
+    )
+    return result.scalars().first()
+
+
+class Principal:
+    """The authenticated caller, detached from any DB session so it can be cached across requests."""
+
+    def __init__(self, id: int, username: str, email: str, roles: List[str], jti: Optional[str] = None, exp: Optional[float] = None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.roles = roles
+        self.mask = role_masks.granted(roles)
+        self.jti = jti
+        self.exp = exp
+
+    @classmethod
+    def from_user(cls, user: User, payload: dict):
+        return cls(user.id, user.username, user.email, [r.name for r in user.roles], payload.get("jti"), payload.get("exp"))
+
+    @classmethod
+    def from_claims(cls, payload: dict):
+        return cls(payload["uid"], payload["sub"], payload.get("email"), list(payload["roles"]), payload.get("jti"), payload.get("exp"))
+
+
+class PrincipalCache:
+    """Principals by access-token jti for up to ttl seconds (LRU-bounded); invalidate_user() is per process."""
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl: float = ROLE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # jti -> (expires at, principal)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+        # Whole seconds, the resolution of a token's iat claim.
+        self._invalidated_at: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.claims_resolved = 0
+        self.db_resolved = 0
+
+    def get(self, jti: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is not None and entry[0] <= time.time():
+                self._discard(jti)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(jti)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, principal: Principal, from_claims: bool):
+        with self._lock:
+            if from_claims:
+                self.claims_resolved += 1
+            else:
+                self.db_resolved += 1
+            if not principal.jti:
+                return
+            expires_at = time.time() + self.ttl
+            if principal.exp is not None:
+                expires_at = min(expires_at, principal.exp)
+            self._entries[principal.jti] = (expires_at, principal)
+            self._entries.move_to_end(principal.jti)
+            self._by_user.setdefault(principal.username, set()).add(principal.jti)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, jti: str):
+        entry = self._entries.pop(jti, None)
+        if entry is not None:
+            principal = entry[1]
+            jtis = self._by_user.get(principal.username)
+            if jtis is not None:
+                jtis.discard(jti)
+                if not jtis:
+                    del self._by_user[principal.username]
+
+    def claims_trusted(self, payload: dict) -> bool:
+        if "uid" not in payload or "roles" not in payload:
+            return False
+        iat = payload.get("iat", 0)
+        if time.time() - iat > self.ttl:
+            # Roles may have changed on another worker since the token was minted.
+            return False
+        invalidated_at = self._invalidated_at.get(payload.get("sub"))
+        return invalidated_at is None or iat > invalidated_at
+
+    def invalidate_user(self, username: str):
+        with self._lock:
+            self._invalidated_at[username] = int(time.time())
+            for jti in list(self._by_user.get(username, ())):
+                self._discard(jti)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "claims_resolved": self.claims_resolved,
+                "db_resolved": self.db_resolved,
+            }
+
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+principal_cache = PrincipalCache()
+
+
+def invalidate_user(username: str):
+    """Call whenever a user's roles or password change; role assignments through User.roles do it on commit."""
+    principal_cache.invalidate_user(username)
+    user_masks.invalidate(username)
+
+
+@event.listens_for(User.roles, "append")
+@event.listens_for(User.roles, "remove")
+def _roles_changed(user, role, initiator):
+    if inspect(user).transient or inspect(user).pending:
+        # A user being created has no tokens or cached masks to drop.
+        return
+    session = object_session(user)
+    if session is None:
+        invalidate_user(user.username)
+    else:
+        session.info.setdefault("role_changes", set()).add(user.username)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_role_changes(session):
+    for username in session.info.pop("role_changes", ()):
+        invalidate_user(username)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_role_changes(session):
+    session.info.pop("role_changes", None)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    with instrumentation.span("auth.get_current_user"):
+        return await _resolve_principal(token, db)
+
+
+async def _resolve_principal(token: str, db: AsyncSession) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -73,35 +297,90 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username)
-    if user is None:
-        raise credentials_exception
-    return user
+
+    jti = payload.get("jti")
+    principal = principal_cache.get(jti) if jti else None
+    if principal is not None:
+        return principal
+
+    # Fast path: access tokens minted by /login carry uid, email and roles,
+    # so the caller can be authorized from the claims without touching the DB.
+    from_claims = principal_cache.claims_trusted(payload)
+    if from_claims:
+        principal = Principal.from_claims(payload)
+    else:
+        user = await async_get_user(db, username)
+        if user is None:
+            raise credentials_exception
+        principal = Principal.from_user(user, payload)
+    principal_cache.put(principal, from_claims)
+    return principal
+
+
+def current_employee_id(db: Session, principal: Principal) -> Optional[int]:
+    """The caller's employee id; not cached on the principal, so reassigned or removed rows apply at once."""
+    return db.scalar(select(EmployeeDB.id).where(EmployeeDB.user_id == principal.id))
 
 
 def require_roles(allowed_roles: List[str]):
-    def role_checker(current_user: User = Depends(get_current_user)):
-        user_roles = [role.name.lower() for role in current_user.roles]
-        expanded_roles = set()
-        for role in user_roles:
-            expanded_roles.update(ROLE_HIERARCHY.get(role, [role]))
-        if not any(role in allowed_roles for role in expanded_roles):
+    required_mask = role_masks.required(allowed_roles)
+
+    def role_checker(current_user: Principal = Depends(get_current_user)):
+        if not current_user.mask & required_mask:
             raise HTTPException(status_code=403, detail="Permission denied")
         return current_user
     return role_checker
 
 
 def get_user_roles(username: str, db: Session) -> List[str]:
-    user = db.query(User).filter(User.username == username).first()
+    user = get_user(db, username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return [role.name for role in user.roles]
 
-def authorize(username: str, resource: str, action: str, db: Session):
-    roles = get_user_roles(username, db)
-    if "admin" not in roles:
+
+class UserMaskCache:
+    """username -> compiled role mask (LRU-bounded), loaded from the DB on first use and kept for up to ttl seconds or until invalidate_user()."""
+
+    def __init__(self, max_size: int = USER_MASK_CACHE_SIZE, ttl: float = ROLE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # username -> (loaded at, mask)
+        self._masks: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generation = 0
+
+    def get(self, username: str, db: Session) -> int:
+        with self._lock:
+            entry = self._masks.get(username)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._masks.move_to_end(username)
+                return entry[1]
+            generation = self._generation
+        loaded_at = time.monotonic()
+        mask = role_masks.granted(get_user_roles(username, db))
+        with self._lock:
+            # Not stored if an invalidation ran while the roles were loading.
+            if generation == self._generation:
+                self._masks[username] = (loaded_at, mask)
+                self._masks.move_to_end(username)
+                while len(self._masks) > self.max_size:
+                    self._masks.popitem(last=False)
+        return mask
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._generation += 1
+            self._masks.pop(username, None)
+
+
+user_masks = UserMaskCache()
+
+
+def check_policy(mask: int, resource: str, action: str):
+    if not mask & POLICY_MASKS.get((resource, action), ADMIN_MASK):
         raise HTTPException(status_code=403, detail="Unauthorized action")
-    
 
-    
 
+def authorize(username: str, resource: str, action: str, db: Session):
+    check_policy(user_masks.get(username, db), resource, action)
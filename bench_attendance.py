@@ -0,0 +1,72 @@
+"""
+Check-in throughput, sync vs async handler, against a scratch SQLite database (BENCH_DATABASE_URL).
+
+    python bench_attendance.py [requests] [concurrency]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("BENCH_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import crud
+import database
+import models
+import schema
+
+
+sync_app = FastAPI()
+async_app = FastAPI()
+
+
+@sync_app.post("/attendance/checkin", status_code=201)
+def sync_checkin(data: schema.AttendanceCreate, db: Session = Depends(database.get_db)):
+    return schema.AttendanceOut.model_validate(crud.check_in(db, data.user_id))
+
+
+@async_app.post("/attendance/checkin", status_code=201)
+async def async_checkin(data: schema.AttendanceCreate, db: AsyncSession = Depends(database.get_async_db)):
+    return schema.AttendanceOut.model_validate(await crud.async_check_in(db, data.user_id))
+
+
+async def run(app, requests: int, concurrency: int) -> float:
+    with database.SessionLocal() as db:
+        db.execute(delete(models.Attendance))
+        db.commit()
+
+    queue = asyncio.Queue()
+    for user_id in range(1, requests + 1):
+        queue.put_nowait(user_id)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                response = await client.post("/attendance/checkin", json={"user_id": queue.get_nowait()})
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+async def main(requests: int, concurrency: int):
+    database.Base.metadata.create_all(bind=database.engine)
+    for name, app in (("threadpool", sync_app), ("async", async_app)):
+        elapsed = await run(app, requests, concurrency)
+        print(f"{name:<10} {requests} check-ins, concurrency {concurrency}: {requests / elapsed:8.1f} req/s")
+    await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    asyncio.run(main(requests, concurrency))
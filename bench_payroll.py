@@ -0,0 +1,60 @@
+"""
+Micro-benchmark: legacy per-row payroll math vs payroll_engine.
+
+    python bench_payroll.py [sizes...]
+"""
+import random
+import sys
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+import payroll_engine
+from payroll_engine import CENT
+
+
+def legacy_per_row(basic_salary, allowances_percent, deductions_percent, absent_days):
+    # Copy of the per-row arithmetic crud.create_payroll used before payroll_engine.
+    allowances_value = basic_salary * (allowances_percent / 100)
+    deductions_value = basic_salary * (deductions_percent / 100)
+    daily_salary = basic_salary / 30
+    absent_deduction = absent_days * daily_salary
+    total_deductions = deductions_value + absent_deduction
+    net_salary = basic_salary + allowances_value - total_deductions
+    return allowances_value, deductions_value, absent_deduction, total_deductions, net_salary
+
+
+def legacy_per_row_rounded(basic_salary, allowances_percent, deductions_percent, absent_days):
+    # Same as above plus the cent rounding Numeric(10, 2) applies, i.e. the values that end up stored.
+    return tuple(
+        Decimal(repr(v)).quantize(CENT, rounding=ROUND_HALF_UP)
+        for v in legacy_per_row(basic_salary, allowances_percent, deductions_percent, absent_days)
+    )
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def run(n: int):
+    rng = random.Random(n)
+    basic = [rng.randint(15_000, 250_000) for _ in range(n)]
+    absent = [rng.randint(0, 5) for _ in range(n)]
+
+    timings = {
+        "per-row": _timed(lambda: [legacy_per_row(b, 20.0, 10.0, a) for b, a in zip(basic, absent)]),
+        "per-row dec": _timed(lambda: [legacy_per_row_rounded(b, 20.0, 10.0, a) for b, a in zip(basic, absent)]),
+        "engine float": _timed(lambda: payroll_engine.compute_payroll_columns(basic, 20.0, 10.0, absent, mode="float")),
+        "engine fixed": _timed(lambda: payroll_engine.compute_payroll_columns(basic, 20.0, 10.0, absent)),
+    }
+    baseline = timings["per-row"]
+    for name, seconds in timings.items():
+        print(f"{n:>9} {name:<13} {seconds:8.3f}s {n / seconds:14,.0f} rows/s {baseline / seconds:6.2f}x")
+
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1:]] or [1_000, 100_000, 1_000_000]
+    print(f"numpy: {'yes' if payroll_engine.np is not None else 'no'}")
+    for size in sizes:
+        run(size)
@@ -1,59 +1,150 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import extract
-from datetime import date, datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, insert, case, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+import time
 from fastapi import HTTPException, status
-from calendar import monthrange 
 import models, schema
+import geofence
+import holiday_calendar
+import location_store
+import pagination
+import payroll_engine
 
 
 
-# Check-In
-def check_in(db: Session, user_id: int):
-    today = date.today()
-    record = db.query(models.Attendance).filter(
-        models.Attendance.user_id == user_id, 
-        models.Attendance.date == today
-    ).first()
-    
-    if record:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="You have already checked in today."
-        )
+ATTENDANCE_COLUMNS = (
+    models.Attendance.user_id,
+    models.Attendance.date,
+    models.Attendance.check_in,
+    models.Attendance.check_out,
+)
 
-    new_att = models.Attendance(user_id=user_id, date=today, check_in=datetime.now())
-    db.add(new_att)
-    db.commit()
-    db.refresh(new_att)
-    return new_att
 
+def dialect_insert(db, table):
+    """INSERT construct of the session's dialect, for ON CONFLICT support."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql_insert(table)
+    return sqlite_insert(table)
 
-# Check-Out
-def check_out(db: Session, user_id: int):
-    today = date.today()
-    record = db.query(models.Attendance).filter(
-        models.Attendance.user_id == user_id, 
-        models.Attendance.date == today
-    ).first()
-    
-    if not record:
-        raise HTTPException(
+
+def _check_in_statement(db, user_id: int):
+    # Single round trip: the unique (user_id, date) index turns a second check-in into a no-op.
+    return dialect_insert(db, models.Attendance).values(
+        user_id=user_id, date=date.today(), check_in=datetime.now()
+    ).on_conflict_do_nothing(
+        index_elements=["user_id", "date"]
+    ).returning(*ATTENDANCE_COLUMNS)
+
+
+def _check_out_statement(user_id: int):
+    return update(models.Attendance).where(
+        models.Attendance.user_id == user_id,
+        models.Attendance.date == date.today(),
+        models.Attendance.check_out.is_(None)
+    ).values(check_out=datetime.now()).returning(*ATTENDANCE_COLUMNS)
+
+
+def _check_in_conflict():
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="You have already checked in today."
+    )
+
+
+def _check_out_error(already_checked_in: bool):
+    # Only reached when the conditional UPDATE matched nothing.
+    if not already_checked_in:
+        return HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No check-in record found for today."
         )
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="You have already checked out today."
+    )
 
-    if record.check_out:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="You have already checked out today."
-        )
 
-    record.check_out = datetime.now()
+def _today_exists(user_id: int):
+    return select(models.Attendance.id).where(
+        models.Attendance.user_id == user_id,
+        models.Attendance.date == date.today()
+    )
+
+
+# Check-In
+def check_in(db: Session, user_id: int):
+    # Insert first so a repeated check-in is a 409 whatever the geofence says.
+    record = db.execute(_check_in_statement(db, user_id)).first()
+    if record is None:
+        db.rollback()
+        raise _check_in_conflict()
+    try:
+        verdict = geofence.evaluate_check_in(db, user_id)
+    except HTTPException:
+        db.rollback()
+        raise
+    record_presence(db, record.user_id, record.date)
+    geofence.record_verification(db, record, verdict)
     db.commit()
-    db.refresh(record)
     return record
 
 
+# Check-Out
+def check_out(db: Session, user_id: int):
+    record = db.execute(_check_out_statement(user_id)).first()
+    if record is None:
+        exists = db.execute(_today_exists(user_id)).first() is not None
+        db.rollback()
+        raise _check_out_error(exists)
+    db.commit()
+    return record
+
+
+# Async Check-In / Check-Out (used by the async attendance endpoints)
+async def async_check_in(db: AsyncSession, user_id: int):
+    record = (await db.execute(_check_in_statement(db, user_id))).first()
+    if record is None:
+        await db.rollback()
+        raise _check_in_conflict()
+    try:
+        verdict = await db.run_sync(geofence.evaluate_check_in, user_id)
+    except HTTPException:
+        await db.rollback()
+        raise
+    await db.run_sync(record_presence, record.user_id, record.date)
+    await db.run_sync(geofence.record_verification, record, verdict)
+    await db.commit()
+    return record
+
+
+async def async_check_out(db: AsyncSession, user_id: int):
+    record = (await db.execute(_check_out_statement(user_id))).first()
+    if record is None:
+        exists = (await db.execute(_today_exists(user_id))).first() is not None
+        await db.rollback()
+        raise _check_out_error(exists)
+    await db.commit()
+    return record
+
+
+# Employee Directory / Location History (keyset paginated)
+def list_employees_page(db: Session, limit: int, cursor: Optional[str] = None, is_active: Optional[bool] = None):
+    query = db.query(models.EmployeeDB)
+    if is_active is not None:
+        query = query.filter(models.EmployeeDB.is_active == is_active)
+    return pagination.keyset_page(query, [models.EmployeeDB.id], cursor, limit)
+
+
+def location_history_page(db: Session, employee_id: Optional[int], limit: int, cursor: Optional[str] = None,
+                          start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Newest first; employee_id=None pages across all employees."""
+    return location_store.store.history_page(db, employee_id, limit, cursor, start, end)
+
+
 # Manual Correction (Admin)
 def manual_update(db: Session, user_id: int, day: date, check_in_dt: datetime, check_out_dt: datetime):
     existing_record = db.query(models.Attendance).filter(
@@ -75,6 +166,8 @@ def manual_update(db: Session, user_id: int, day: date, check_in_dt: datetime, c
             check_out=check_out_dt
         )
         db.add(new_record)
+        db.flush()
+        record_presence(db, user_id, day)
         db.commit()
         db.refresh(new_record)
         return new_record
@@ -82,9 +175,9 @@ def manual_update(db: Session, user_id: int, day: date, check_in_dt: datetime, c
 
 # Daily Report
 def daily_report(db: Session, day: date):
-    holiday = db.query(models.Holiday).filter(models.Holiday.date == day).first()
-    if holiday:
-        return schema.HolidayCreate(date=holiday.date, name=holiday.name)
+    calendar = holiday_calendar.holidays.ensure(db)
+    if calendar.is_holiday(day):
+        return schema.HolidayCreate(date=day, name=calendar.name(day))
     
     rows = db.query(models.Attendance).filter(models.Attendance.date == day).all()
     return rows
@@ -98,7 +191,9 @@ def create_holiday(db: Session, holiday: schema.HolidayCreate):
     
     db_holiday = models.Holiday(date=holiday.date, name=holiday.name)
     db.add(db_holiday)
+    _shift_rollups_for_holiday(db, holiday.date, 1)
     db.commit()
+    holiday_calendar.holidays.invalidate()
     db.refresh(db_holiday)
     return db_holiday
 
@@ -115,66 +210,207 @@ def delete_holiday(db: Session, holiday: schema.HolidayDelete):
         )
 
     db.delete(db_holiday)
+    _shift_rollups_for_holiday(db, holiday.date, -1)
     db.commit()
+    holiday_calendar.holidays.invalidate()
     return db_holiday
 
 
 
+def month_range(year: int, month: int):
+    """Half-open [first day, first day of next month) so date filters can use the (user_id, date) index."""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def attendance_summaries(db: Session, user_ids, start: date, end: date, user_filter=None, calendar=None):
+    """AttendanceSummary per user for [start, end) in one query; pass calendar only for read-only reports."""
+    if calendar is not None:
+        holiday_dates = calendar.holiday_dates(start, end)
+        holidays_count = len(holiday_dates)
+    else:
+        holiday_dates = select(models.Holiday.date).where(
+            models.Holiday.date >= start,
+            models.Holiday.date < end
+        )
+        holidays_count = db.scalar(select(func.count()).select_from(holiday_dates.subquery()))
+    total_days = (end - start).days
+
+    rows = db.execute(select(
+        models.Attendance.user_id,
+        func.count(func.distinct(models.Attendance.date)),
+        func.count(func.distinct(case(
+            (models.Attendance.date.in_(holiday_dates), models.Attendance.date)
+        )))
+    ).where(
+        models.Attendance.user_id.in_(user_filter if user_filter is not None else list(user_ids)),
+        models.Attendance.date >= start,
+        models.Attendance.date < end
+    ).group_by(models.Attendance.user_id))
+
+    summaries = {
+        user_id: schema.AttendanceSummary(
+            total_days=total_days,
+            present_days=0,
+            absent_days=total_days - holidays_count,
+            holidays=holidays_count
+        )
+        for user_id in user_ids
+    }
+    for user_id, present_days, present_on_holidays in rows:
+        summaries[user_id] = schema.AttendanceSummary(
+            total_days=total_days,
+            present_days=present_days,
+            absent_days=total_days - holidays_count - present_days + present_on_holidays,
+            holidays=holidays_count
+        )
+    return summaries
+
+
+# Monthly Attendance Rollup
+ROLLUP_BATCH_SIZE = 1000
+
+
+def record_presence(db: Session, user_id: int, day: date):
+    """Counts a newly inserted attendance day in its month's rollup row, creating the row on first use."""
+    rollup = models.MonthlyAttendanceRollup
+    on_holiday = select(models.Holiday.id).where(models.Holiday.date == day).exists()
+    result = db.execute(update(rollup).where(
+        rollup.user_id == user_id,
+        rollup.year == day.year,
+        rollup.month == day.month
+    ).values(
+        present=rollup.present + 1,
+        # A day worked on a holiday was never counted as absent.
+        absent=rollup.absent - case((on_holiday, 0), else_=1)
+    ).execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        refresh_rollups(db, [(user_id, day.year, day.month)])
+
+
+def _shift_rollups_for_holiday(db: Session, day: date, delta: int):
+    """Adds (delta=1) or removes (delta=-1) a holiday from every rollup row of its month in one UPDATE."""
+    rollup = models.MonthlyAttendanceRollup
+    present = select(models.Attendance.id).where(
+        models.Attendance.user_id == rollup.user_id,
+        models.Attendance.date == day
+    ).exists()
+    db.execute(update(rollup).where(
+        rollup.year == day.year,
+        rollup.month == day.month
+    ).values(
+        holidays=rollup.holidays + delta,
+        absent=rollup.absent - case((present, 0), else_=delta)
+    ).execution_options(synchronize_session=False))
+
+
+def store_rollups(db: Session, year: int, month: int, summaries):
+    """Upserts {user_id: AttendanceSummary} as the rollup rows of the month; the caller commits."""
+    items = list(summaries.items())
+    now = datetime.utcnow()
+    for offset in range(0, len(items), ROLLUP_BATCH_SIZE):
+        stmt = dialect_insert(db, models.MonthlyAttendanceRollup).values([
+            {
+                "user_id": user_id,
+                "year": year,
+                "month": month,
+                "present": summary.present_days,
+                "absent": summary.absent_days,
+                "holidays": summary.holidays,
+                "updated_at": now,
+            }
+            for user_id, summary in items[offset:offset + ROLLUP_BATCH_SIZE]
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "year", "month"],
+            set_={
+                "present": stmt.excluded.present,
+                "absent": stmt.excluded.absent,
+                "holidays": stmt.excluded.holidays,
+                "updated_at": stmt.excluded.updated_at,
+            }
+        ))
+
+
+def refresh_rollups(db: Session, keys):
+    """Recomputes the rollup rows for (user_id, year, month) keys from attendance, one query per month."""
+    by_month = {}
+    for user_id, year, month in keys:
+        by_month.setdefault((year, month), set()).add(user_id)
+    for (year, month), user_ids in by_month.items():
+        store_rollups(db, year, month, attendance_summaries(db, sorted(user_ids), *month_range(year, month)))
+
+
+def rollup_summaries(db: Session, user_ids, year: int, month: int, user_filter=None, store_missing: bool = False):
+    """
+    AttendanceSummary per user for a calendar month, read from the rollup table.
+    Users without a rollup row yet are computed from attendance (and stored if store_missing).
+    """
+    start, end = month_range(year, month)
+    total_days = (end - start).days
+    rollup = models.MonthlyAttendanceRollup
+    user_ids = list(user_ids)
+    rows = db.execute(select(
+        rollup.user_id, rollup.present, rollup.absent, rollup.holidays
+    ).where(
+        rollup.user_id.in_(user_filter if user_filter is not None else user_ids),
+        rollup.year == year,
+        rollup.month == month
+    ))
+    summaries = {
+        user_id: schema.AttendanceSummary(
+            total_days=total_days,
+            present_days=present,
+            absent_days=absent,
+            holidays=holidays
+        )
+        for user_id, present, absent, holidays in rows
+    }
+
+    missing = [user_id for user_id in user_ids if user_id not in summaries]
+    if missing:
+        computed = attendance_summaries(
+            db, missing, start, end,
+            user_filter=user_filter if len(missing) == len(user_ids) else None,
+            calendar=None if store_missing else holiday_calendar.holidays.ensure(db)
+        )
+        if store_missing:
+            store_rollups(db, year, month, {u: s for u, s in computed.items() if u is not None})
+        summaries.update(computed)
+    return {user_id: summaries[user_id] for user_id in user_ids}
+
+
 def get_monthly_summary(db: Session, user_id: int, year: int, month: int):
-    present_dates = db.query(models.Attendance.date).filter(
-        models.Attendance.user_id == user_id,
-        extract('year', models.Attendance.date) == year,
-        extract('month', models.Attendance.date) == month
-    ).all()
-
-    holiday_dates = db.query(models.Holiday.date).filter(
-        extract('year', models.Holiday.date) == year,
-        extract('month', models.Holiday.date) == month
-    ).all()
-    
-    present_dates_set = {d[0] for d in present_dates}
-    holiday_dates_set = {h[0] for h in holiday_dates}
-    
-    _, total_days = monthrange(year, month)
-    
-    present_days_count = len(present_dates_set)
-    holidays_count = len(holiday_dates_set)
+    return rollup_summaries(db, [user_id], year, month)[user_id]
 
-    total_days_in_month_set = {date(year, month, day) for day in range(1, total_days + 1)}
-    
-    absent_days_count = len(total_days_in_month_set - present_dates_set - holiday_dates_set)
-    
-    return schema.AttendanceSummary(
-        total_days=total_days,
-        present_days=present_days_count,
-        absent_days=absent_days_count,
-        holidays=holidays_count
+
+def get_monthly_summaries(db: Session, year: int, month: int, department_id: Optional[int] = None):
+    """Monthly summaries for every active employee (optionally one department) without N+1 calls."""
+    users = select(models.EmployeeDB.user_id).where(
+        models.EmployeeDB.is_active.is_(True),
+        models.EmployeeDB.user_id.is_not(None)
     )
+    if department_id is not None:
+        users = users.where(models.EmployeeDB.department_id == department_id)
+    user_ids = db.scalars(users.order_by(models.EmployeeDB.user_id)).all()
+    return rollup_summaries(db, user_ids, year, month, user_filter=users)
 
 
 def create_payroll(db: Session, payload: schema.PayrollCreate):
-    allowances_value = payload.basic_salary * (payload.allowances_percent / 100)
-    deductions_value = payload.basic_salary * (payload.deductions_percent / 100)
-    
-   
-    daily_salary = payload.basic_salary / 30
-    absent_deduction = payload.absent_days * daily_salary
-    
-    total_deductions = deductions_value + absent_deduction
-    net_salary = payload.basic_salary + allowances_value - total_deductions
+    values = payroll_engine.compute_payroll(
+        payload.basic_salary,
+        payload.allowances_percent,
+        payload.deductions_percent,
+        payload.absent_days
+    )
 
     new_payroll = models.Payroll(
         employee_id=payload.employee_id,
         period_start=payload.period_start,
         period_end=payload.period_end,
-        basic_salary=payload.basic_salary,
-        allowances=allowances_value, 
-        deductions=deductions_value,  
-        absent_deduction=absent_deduction, 
-        total_deductions=total_deductions,
-        absent_days=payload.absent_days,
-        net_salary=net_salary,
-        generated_at=datetime.utcnow()
+        generated_at=datetime.utcnow(),
+        **values
     )
     
     db.add(new_payroll)
@@ -184,6 +420,80 @@ def create_payroll(db: Session, payload: schema.PayrollCreate):
     return new_payroll
 
 
+# Payroll Run (Admin)
+def run_payroll(db: Session, payload: schema.PayrollRunCreate):
+    started = time.perf_counter()
+
+    query = db.query(models.EmployeeDB).filter(models.EmployeeDB.is_active.is_(True))
+    if payload.department_id is not None:
+        query = query.filter(models.EmployeeDB.department_id == payload.department_id)
+    if payload.employee_ids:
+        query = query.filter(models.EmployeeDB.id.in_(payload.employee_ids))
+    employees = query.all()
+
+    existing = {
+        row[0] for row in db.query(models.Payroll.employee_id).filter(
+            models.Payroll.employee_id.in_([e.id for e in employees]),
+            models.Payroll.period_start == payload.period_start,
+            models.Payroll.period_end == payload.period_end
+        )
+    }
+    candidates = [e for e in employees if e.id not in existing and e.salary is not None]
+    user_filter = query.with_entities(models.EmployeeDB.user_id).scalar_subquery()
+    period_end = payload.period_end + timedelta(days=1)
+    if (payload.period_start, period_end) == month_range(payload.period_start.year, payload.period_start.month):
+        # Calendar month: one rollup row per employee.
+        summaries = rollup_summaries(
+            db,
+            [e.user_id for e in candidates],
+            payload.period_start.year,
+            payload.period_start.month,
+            user_filter=user_filter,
+            store_missing=True
+        )
+    else:
+        summaries = attendance_summaries(
+            db,
+            [e.user_id for e in candidates],
+            payload.period_start,
+            period_end,
+            user_filter=user_filter
+        )
+
+    columns = payroll_engine.compute_payroll_columns(
+        [e.salary for e in candidates],
+        payload.allowances_percent,
+        payload.deductions_percent,
+        [summaries[e.user_id].absent_days for e in candidates]
+    )
+    generated_at = datetime.utcnow()
+    rows = [
+        {
+            "employee_id": e.id,
+            "period_start": payload.period_start,
+            "period_end": payload.period_end,
+            "generated_at": generated_at,
+            **values
+        }
+        for e, values in zip(candidates, payroll_engine.iter_payroll_rows(columns))
+    ]
+    if rows:
+        db.execute(insert(models.Payroll), rows)
+    db.commit()
+
+    elapsed = time.perf_counter() - started
+    return schema.PayrollRunResult(
+        period_start=payload.period_start,
+        period_end=payload.period_end,
+        employees_considered=len(employees),
+        created=len(rows),
+        skipped_duplicates=len(existing),
+        skipped_missing_salary=len(employees) - len(existing) - len(candidates),
+        elapsed_seconds=round(elapsed, 4),
+        rows_per_second=round(len(rows) / elapsed, 2) if elapsed > 0 else 0.0
+    )
+
+
 def get_payroll_for_employee(db: Session, employee_id: int, start: date, end: date):
     return db.query(models.Payroll).filter(
         models.Payroll.employee_id == employee_id,
@@ -196,8 +506,38 @@ def get_latest_payroll(db: Session, employee_id: int):
         models.Payroll.employee_id == employee_id
     ).order_by(models.Payroll.generated_at.desc()).first()
     
-def list_payrolls_for_period(db: Session, start: date, end: date):
-    return db.query(models.Payroll).filter(
+def list_payrolls_for_period(db: Session, start: date, end: date,
+                             employee_id: Optional[int] = None, department_id: Optional[int] = None):
+    """Payrolls in the period for everyone, one department or one employee; the scope is part of the WHERE clause."""
+    query = db.query(models.Payroll).filter(
         models.Payroll.period_start >= start,
         models.Payroll.period_end <= end
-    ).all()
\ No newline at end of file
+    )
+    if employee_id is not None:
+        query = query.filter(models.Payroll.employee_id == employee_id)
+    if department_id is not None:
+        query = query.join(models.EmployeeDB, models.EmployeeDB.id == models.Payroll.employee_id).filter(
+            models.EmployeeDB.department_id == department_id
+        )
+    return query.order_by(models.Payroll.employee_id, models.Payroll.period_start).all()
+
+
+def payroll_totals_by_department(db: Session, start: date, end: date):
+    """Per-department sums for the period computed by the database; no Payroll objects are loaded."""
+    payroll = models.Payroll
+    rows = db.execute(select(
+        models.EmployeeDB.department_id,
+        func.count(func.distinct(payroll.employee_id)).label("employees"),
+        func.count(payroll.id).label("payrolls"),
+        func.coalesce(func.sum(payroll.basic_salary), 0).label("basic_salary"),
+        func.coalesce(func.sum(payroll.allowances), 0).label("allowances"),
+        func.coalesce(func.sum(payroll.total_deductions), 0).label("total_deductions"),
+        func.coalesce(func.sum(payroll.absent_days), 0).label("absent_days"),
+        func.coalesce(func.sum(payroll.net_salary), 0).label("net_salary")
+    ).join(
+        models.EmployeeDB, models.EmployeeDB.id == payroll.employee_id
+    ).where(
+        payroll.period_start >= start,
+        payroll.period_end <= end
+    ).group_by(models.EmployeeDB.department_id).order_by(models.EmployeeDB.department_id))
+    return [schema.PayrollDepartmentTotal(**row._mapping) for row in rows]
\ No newline at end of file
@@ -1,18 +1,175 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite:///./payroll.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./payroll.db")
+# Reports can be pointed at a replica; by default they read the primary through a separate read-only pool.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL", DATABASE_URL)
+
+# Async driver for the same database: aiosqlite for SQLite, asyncpg for PostgreSQL.
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_ECHO = os.getenv("DB_ECHO", "").lower() in ("1", "true", "yes")
+
+# Applied on every new SQLite connection. WAL lets the attendance check-in burst
+# write while reports keep reading; NORMAL sync is durable across app crashes in WAL mode.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB, i.e. 64 MiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _engine_options(url: str):
+    options = {"echo": DB_ECHO}
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        if make_url(url).database in (None, "", ":memory:"):
+            return options
+    else:
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = DB_POOL_RECYCLE
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"no async driver configured for {parsed.get_backend_name()}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def _install_connect_hooks(engine, url: str, read_only: bool):
+    if _is_sqlite(url):
+        @event.listens_for(engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+    elif read_only and engine.dialect.name == "postgresql":
+        @event.listens_for(engine, "connect")
+        def _set_read_only(dbapi_connection, connection_record):
+            # Outside a transaction: inside psycopg's implicit one the pool's reset rollback would undo it.
+            autocommit = dbapi_connection.autocommit
+            dbapi_connection.autocommit = True
+            try:
+                cursor = dbapi_connection.cursor()
+                cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+                cursor.close()
+            finally:
+                dbapi_connection.autocommit = autocommit
+
+
+def make_engine(url: str, read_only: bool = False):
+    engine = create_engine(url, **_engine_options(url))
+    _install_connect_hooks(engine, url, read_only)
+    return engine
+
+
+def make_async_engine(url: str):
+    engine = create_async_engine(url, **_engine_options(url))
+    # Pragmas are set through the sync facade; the aiosqlite/asyncpg adapters expose a DB-API cursor there.
+    _install_connect_hooks(engine.sync_engine, url, read_only=False)
+    return engine
+
+
+engine = make_engine(DATABASE_URL)
+read_engine = make_engine(READ_DATABASE_URL, read_only=True)
+async_engine = make_async_engine(os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
 Base.metadata.create_all(bind=engine)
 
+def create_missing_indexes(bind=engine):
+    """
+    create_all() only creates missing tables; this adds indexes declared later to existing tables.
+    Fails startup if one cannot be built: upserts rely on the unique ones being there.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=bind, checkfirst=True)
+            except DatabaseError as exc:
+                columns = ", ".join(c.name for c in index.columns)
+                hint = f"; remove duplicate ({columns}) rows from {table.name} and restart" if index.unique else ""
+                raise RuntimeError(f"could not create index {index.name} on {table.name}{hint}") from exc
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """
+    Fails on exit when more than budget statements ran on the engines (all three by default):
+
+        with database.QueryCounter(budget=2):
+            client.get("/employees/1", headers={"username": "admin"})
+    """
+
+    def __init__(self, budget: int = None, engines=None):
+        self.budget = budget
+        self.engines = engines if engines is not None else [engine, read_engine, async_engine.sync_engine]
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        for target in self.engines:
+            event.listen(target, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for target in self.engines:
+            event.remove(target, "before_cursor_execute", self._record)
+        if exc_type is None and self.budget is not None and self.count > self.budget:
+            listing = "\n".join(f"  {s}" for s in self.statements)
+            raise QueryBudgetExceeded(f"{self.count} statements, budget is {self.budget}:\n{listing}")
+        return False
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,94 @@
+"""Streaming NDJSON / CSV exports, read in chunks of EXPORT_CHUNK_ROWS from a server-side cursor."""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+import csv
+import io
+import json
+import os
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+import database
+import models
+
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "2000"))
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_cell(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def iter_export(statements, fmt: str, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Streams SELECTs with the same columns as NDJSON or CSV, from its own read session."""
+    if not isinstance(statements, (list, tuple)):
+        statements = [statements]
+    db = database.ReadSessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        header_written = False
+        for statement in statements:
+            result = db.execute(statement.execution_options(stream_results=True, yield_per=chunk_rows))
+            keys = list(result.keys())
+            if writer is not None and not header_written:
+                writer.writerow(keys)
+                header_written = True
+            for partition in result.partitions():
+                for row in partition:
+                    if writer is not None:
+                        writer.writerow([_csv_cell(v) for v in row])
+                    else:
+                        buffer.write(json.dumps(dict(zip(keys, row)), default=_json_default))
+                        buffer.write("\n")
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+def export_response(statements, fmt: str, filename: str):
+    return StreamingResponse(
+        iter_export(statements, fmt),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+
+def payroll_export_statement(period_start: date, period_end: date, employee_id: Optional[int] = None,
+                             department_id: Optional[int] = None):
+    payroll = models.Payroll
+    statement = select(
+        payroll.id, payroll.employee_id, payroll.period_start, payroll.period_end,
+        payroll.basic_salary, payroll.allowances, payroll.total_deductions,
+        payroll.absent_days, payroll.net_salary, payroll.generated_at
+    ).where(
+        payroll.period_start >= period_start,
+        payroll.period_end <= period_end
+    )
+    if department_id is not None:
+        statement = statement.join(models.EmployeeDB, models.EmployeeDB.id == payroll.employee_id).where(
+            models.EmployeeDB.department_id == department_id
+        )
+    if employee_id is not None:
+        statement = statement.where(payroll.employee_id == employee_id)
+    return statement.order_by(payroll.employee_id, payroll.period_start, payroll.id)
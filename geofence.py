@@ -0,0 +1,327 @@
+"""Geofenced check-ins against office sites (circles or polygons), bucketed in a GEOFENCE_CELL_DEGREES grid."""
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time as dtime, timedelta, timezone
+import json
+import math
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the pure Python path gives identical results
+    np = None
+
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import location_store
+import models
+
+
+GEOFENCE_MODE = os.getenv("GEOFENCE_MODE", "flag")
+GEOFENCE_CELL_DEGREES = float(os.getenv("GEOFENCE_CELL_DEGREES", "0.01"))
+GEOFENCE_MAX_FENCE_CELLS = int(os.getenv("GEOFENCE_MAX_FENCE_CELLS", "1024"))
+GEOFENCE_INDEX_TTL = float(os.getenv("GEOFENCE_INDEX_TTL", "60"))
+GEOFENCE_MAX_PING_AGE_MINUTES = float(os.getenv("GEOFENCE_MAX_PING_AGE_MINUTES", "15"))
+GEOFENCE_TRACK_WINDOW_MINUTES = float(os.getenv("GEOFENCE_TRACK_WINDOW_MINUTES", "30"))
+EARTH_RADIUS_M = 6_371_008.8
+METERS_PER_DEGREE_LAT = 111_320.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_matrix(lats, lons, site_lats, site_lons):
+    """Distances in metres from every point to every site, as rows of points."""
+    if np is None:
+        return [[haversine_m(lat, lon, slat, slon) for slat, slon in zip(site_lats, site_lons)] for lat, lon in zip(lats, lons)]
+    phi = np.radians(np.asarray(lats, dtype=np.float64))[:, None]
+    lam = np.radians(np.asarray(lons, dtype=np.float64))[:, None]
+    site_phi = np.radians(np.asarray(site_lats, dtype=np.float64))[None, :]
+    site_lam = np.radians(np.asarray(site_lons, dtype=np.float64))[None, :]
+    a = np.sin((site_phi - phi) / 2) ** 2 + np.cos(phi) * np.cos(site_phi) * np.sin((site_lam - lam) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def point_in_polygon(lat: float, lon: float, polygon) -> bool:
+    """Ray casting in the lat/lon plane, fine at office-campus scale."""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lon_i = polygon[i]
+        lat_j, lon_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat) and lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+            inside = not inside
+        j = i
+    return inside
+
+
+def local_to_utc(value: datetime) -> datetime:
+    """Attendance times are naive server-local, pings naive UTC."""
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class Fence:
+    def __init__(self, site: models.OfficeSite):
+        self.site_id = site.id
+        self.name = site.name
+        self.kind = site.kind
+        self.latitude = site.latitude
+        self.longitude = site.longitude
+        self.radius_m = site.radius_m
+        self.polygon = json.loads(site.polygon) if site.polygon else None
+
+    def bbox(self):
+        if self.polygon:
+            lats = [v[0] for v in self.polygon]
+            lons = [v[1] for v in self.polygon]
+            return min(lats), min(lons), max(lats), max(lons)
+        dlat = self.radius_m / METERS_PER_DEGREE_LAT
+        dlon = self.radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(self.latitude)), 1e-6))
+        return self.latitude - dlat, self.longitude - dlon, self.latitude + dlat, self.longitude + dlon
+
+    def contains(self, lat: float, lon: float, distance_m: float = None) -> bool:
+        """distance_m (to the site centre) can be passed in when already computed."""
+        if distance_m is None:
+            distance_m = haversine_m(lat, lon, self.latitude, self.longitude)
+        if distance_m > self.radius_m:
+            return False
+        return self.polygon is None or point_in_polygon(lat, lon, self.polygon)
+
+
+class FenceIndex:
+    def __init__(self, fences, cell_degrees: float = GEOFENCE_CELL_DEGREES, max_cells: int = GEOFENCE_MAX_FENCE_CELLS):
+        self.fences = list(fences)
+        self.cell_degrees = cell_degrees
+        self._cells = {}
+        # Fences spanning more than max_cells cells are checked for every point instead.
+        self._wide = []
+        for fence in self.fences:
+            min_lat, min_lon, max_lat, max_lon = fence.bbox()
+            (i0, j0), (i1, j1) = self._cell(min_lat, min_lon), self._cell(max_lat, max_lon)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > max_cells:
+                self._wide.append(fence)
+                continue
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    self._cells.setdefault((i, j), []).append(fence)
+
+    def __len__(self):
+        return len(self.fences)
+
+    def _cell(self, lat: float, lon: float):
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def locate(self, lat: float, lon: float):
+        """(fence, distance to its centre in metres) of the nearest fence containing the point, or (None, None)."""
+        best, best_distance = None, None
+        for fence in self._cells.get(self._cell(lat, lon), []) + self._wide:
+            distance = haversine_m(lat, lon, fence.latitude, fence.longitude)
+            if fence.contains(lat, lon, distance) and (best is None or distance < best_distance):
+                best, best_distance = fence, distance
+        return best, best_distance
+
+
+class FenceRegistry:
+    """Process-wide FenceIndex over the active sites, rebuilt after ttl seconds or when sites change here."""
+
+    def __init__(self, ttl: float = GEOFENCE_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index = None
+        self._loaded_at = None
+
+    def index(self, db: Session) -> FenceIndex:
+        loaded_at = self._loaded_at
+        if self._index is None or loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            sites = db.scalars(select(models.OfficeSite).where(models.OfficeSite.is_active.is_(True))).all()
+            index = FenceIndex(Fence(site) for site in sites)
+            with self._lock:
+                self._index = index
+                self._loaded_at = time.monotonic()
+        return self._index
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+fences = FenceRegistry()
+
+
+# Sites
+def create_site(db: Session, site):
+    if site.polygon:
+        vertices = [[float(lat), float(lon)] for lat, lon in site.polygon]
+        lat = sum(v[0] for v in vertices) / len(vertices)
+        lon = sum(v[1] for v in vertices) / len(vertices)
+        radius = max(haversine_m(lat, lon, v[0], v[1]) for v in vertices)
+        db_site = models.OfficeSite(
+            name=site.name, kind="polygon", latitude=lat, longitude=lon, radius_m=radius, polygon=json.dumps(vertices)
+        )
+    else:
+        db_site = models.OfficeSite(
+            name=site.name, kind="radius", latitude=site.latitude, longitude=site.longitude, radius_m=site.radius_m
+        )
+    db.add(db_site)
+    db.commit()
+    db.refresh(db_site)
+    fences.invalidate()
+    return db_site
+
+
+def deactivate_site(db: Session, site_id: int):
+    site = db.get(models.OfficeSite, site_id)
+    if site is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    site.is_active = False
+    db.commit()
+    db.refresh(site)
+    fences.invalidate()
+    return site
+
+
+# Check-in verification
+def evaluate_check_in(db: Session, user_id: int, now: datetime = None):
+    """
+    Verdict for a check-in from the user's latest ping, or None when geofencing is
+    off or no sites are configured. Raises 403 in enforce mode unless inside a fence.
+    """
+    if GEOFENCE_MODE == "off":
+        return None
+    index = fences.index(db)
+    if not len(index):
+        return None
+
+    now = now or datetime.utcnow()
+    employee_id = db.scalar(select(models.EmployeeDB.id).where(models.EmployeeDB.user_id == user_id))
+    ping = location_store.store.latest(db, employee_id) if employee_id is not None else None
+    verdict = {"status": "no_location", "site_id": None, "distance_m": None, "location_id": None, "ping_at": None}
+    if ping is not None:
+        verdict.update(location_id=ping.id, ping_at=ping.timestamp)
+        if now - ping.timestamp > timedelta(minutes=GEOFENCE_MAX_PING_AGE_MINUTES):
+            verdict["status"] = "stale"
+        else:
+            fence, distance = index.locate(ping.latitude, ping.longitude)
+            verdict["status"] = "inside" if fence is not None else "outside"
+            if fence is not None:
+                verdict.update(site_id=fence.site_id, distance_m=round(distance, 1))
+
+    if GEOFENCE_MODE == "enforce" and verdict["status"] != "inside":
+        reasons = {
+            "outside": "your latest location is outside every office site",
+            "stale": "your latest location is too old",
+            "no_location": "no location has been reported",
+        }
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Check-in rejected: {reasons[verdict['status']]}.")
+    return verdict
+
+
+def record_verification(db: Session, record, verdict):
+    """Stores the verdict next to a new attendance row, replacing one left from a deleted row; the caller commits."""
+    if verdict is None:
+        return
+    existing = db.query(models.CheckinVerification).filter_by(user_id=record.user_id, date=record.date).first()
+    if existing is None:
+        db.add(models.CheckinVerification(user_id=record.user_id, date=record.date, **verdict))
+    else:
+        for key, value in dict(verdict, verified_at=datetime.utcnow(), track_points=None, track_inside=None,
+                               track_min_distance_m=None, scored_at=None).items():
+            setattr(existing, key, value)
+    db.flush()
+
+
+def list_verifications(db: Session, day: date, verdict_status: str = None):
+    query = db.query(models.CheckinVerification).filter(models.CheckinVerification.date == day)
+    if verdict_status:
+        query = query.filter(models.CheckinVerification.status == verdict_status)
+    return query.order_by(models.CheckinVerification.user_id).all()
+
+
+# Batch scoring
+def _score_points(points, index: FenceIndex):
+    """(inside count, distance in metres to the nearest fence edge) for a list of (lat, lon)."""
+    lats = [p[0] for p in points]
+    lons = [p[1] for p in points]
+    distances = haversine_matrix(lats, lons, [f.latitude for f in index.fences], [f.longitude for f in index.fences])
+    radii = [f.radius_m for f in index.fences]
+    if np is not None:
+        candidate = distances <= np.asarray(radii)[None, :]
+        to_edge = float(np.maximum(distances - np.asarray(radii)[None, :], 0).min())
+        candidate_rows = [np.flatnonzero(row).tolist() for row in candidate]
+    else:
+        candidate_rows = [[j for j, d in enumerate(row) if d <= radii[j]] for row in distances]
+        to_edge = min(max(d - radii[j], 0.0) for row in distances for j, d in enumerate(row))
+
+    inside = 0
+    for (lat, lon), row in zip(points, candidate_rows):
+        # Circles are settled by the distance test; polygons still need their exact test.
+        if any(index.fences[j].polygon is None or point_in_polygon(lat, lon, index.fences[j].polygon) for j in row):
+            inside += 1
+    return inside, (0.0 if inside else round(to_edge, 1))
+
+
+def score_day(db: Session, day: date):
+    """Scores each of day's check-ins against the pings around it: points inside a fence and how close the track came."""
+    started = time.perf_counter()
+    index = fences.index(db)
+    checkins = db.execute(select(
+        models.Attendance.user_id, models.Attendance.check_in, models.EmployeeDB.id.label("employee_id")
+    ).join(
+        models.EmployeeDB, models.EmployeeDB.user_id == models.Attendance.user_id
+    ).where(
+        models.Attendance.date == day,
+        models.Attendance.check_in.is_not(None)
+    )).all()
+    if not checkins or not len(index):
+        return {"date": day, "checkins": len(checkins), "scored": 0, "points": 0, "elapsed_seconds": 0.0}
+
+    window = timedelta(minutes=GEOFENCE_TRACK_WINDOW_MINUTES)
+    track = location_store.store.track(
+        db, {c.employee_id for c in checkins},
+        local_to_utc(datetime.combine(day, dtime.min)) - window, local_to_utc(datetime.combine(day, dtime.max)) + window
+    )
+    by_employee = {}
+    for row in track:
+        times, points = by_employee.setdefault(row.employee_id, ([], []))
+        times.append(row.timestamp)
+        points.append((row.latitude, row.longitude))
+
+    existing = {
+        v.user_id: v for v in db.scalars(select(models.CheckinVerification).where(models.CheckinVerification.date == day))
+    }
+    scored_at = datetime.utcnow()
+    total_points = 0
+    for checkin in checkins:
+        times, points = by_employee.get(checkin.employee_id, ([], []))
+        check_in = local_to_utc(checkin.check_in)
+        lo, hi = bisect_left(times, check_in - window), bisect_right(times, check_in + window)
+        window_points = points[lo:hi]
+        total_points += len(window_points)
+        inside, to_edge = _score_points(window_points, index) if window_points else (0, None)
+
+        verification = existing.get(checkin.user_id)
+        if verification is None:
+            verification = models.CheckinVerification(
+                user_id=checkin.user_id, date=day,
+                status="inside" if inside else ("outside" if window_points else "no_location")
+            )
+            db.add(verification)
+        verification.track_points = len(window_points)
+        verification.track_inside = inside
+        verification.track_min_distance_m = to_edge
+        verification.scored_at = scored_at
+    db.commit()
+
+    return {
+        "date": day,
+        "checkins": len(checkins),
+        "scored": len(checkins),
+        "points": total_points,
+        "elapsed_seconds": round(time.perf_counter() - started, 4),
+    }
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import os
+import threading
+import time
+
+from fastapi import HTTPException, status
+from passlib.hash import bcrypt
+
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "4"))
+# Each pending hash holds a request thread; main sizes the request threadpool to REQUEST_THREADS.
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 2)))
+REQUEST_THREADS = int(os.getenv("REQUEST_THREADS", "40"))
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+LATENCY_SAMPLES = 1000
+
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int = BCRYPT_MIN_ROUNDS, max_rounds: int = BCRYPT_MAX_ROUNDS) -> int:
+    """Highest bcrypt cost whose hash time here stays within target_ms, extrapolated from one hash at min_rounds."""
+    started = time.perf_counter()
+    bcrypt.using(rounds=min_rounds).hash("calibration-password")
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed_ms * 2 <= target_ms:
+        elapsed_ms *= 2
+        rounds += 1
+    return rounds
+
+
+def configured_bcrypt_rounds() -> int:
+    if os.getenv("BCRYPT_ROUNDS"):
+        return int(os.environ["BCRYPT_ROUNDS"])
+    if os.getenv("BCRYPT_TARGET_MS"):
+        return calibrate_bcrypt_rounds(float(os.environ["BCRYPT_TARGET_MS"]))
+    return 12
+
+
+class HashingExecutor:
+    """Hashes passwords on a dedicated pool; callers beyond max_pending (at most a quarter of the request threads) get a 429."""
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING,
+                 request_threads: int = REQUEST_THREADS):
+        self.workers = workers
+        self.max_pending = min(max_pending, max(workers, request_threads // 4))
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hashing")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.completed = 0
+        self.rejected = 0
+
+    def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many authentication requests, retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+                self._latencies.append(elapsed)
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._latencies)
+            pending = self._pending
+
+        def percentile(q):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 2)
+
+        return {
+            "workers": self.workers,
+            "queue_depth": pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p95": percentile(0.95),
+            "latency_ms_max": percentile(1.0),
+        }
+
+
+executor = HashingExecutor()
@@ -0,0 +1,118 @@
+from datetime import date, timedelta
+from functools import lru_cache
+import os
+import threading
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+
+
+HOLIDAY_CACHE_TTL = float(os.getenv("HOLIDAY_CACHE_TTL", "300"))
+# Weekday numbers as in date.weekday(): Monday is 0, Saturday 5, Sunday 6.
+WEEKEND_DAYS = frozenset(int(d) for d in os.getenv("WEEKEND_DAYS", "5,6").split(",") if d.strip())
+
+
+def _year_start(year: int) -> date:
+    return date(year, 1, 1)
+
+
+def _range_masks(start: date, end: date):
+    """Yields (year, mask) covering the half-open range [start, end); bit n is day-of-year n + 1."""
+    if end <= start:
+        return
+    for year in range(start.year, (end - timedelta(days=1)).year + 1):
+        first = _year_start(year)
+        lo = (start - first).days if year == start.year else 0
+        hi = (end - first).days if year == end.year else (_year_start(year + 1) - first).days
+        yield year, ((1 << hi) - 1) ^ ((1 << lo) - 1)
+
+
+@lru_cache(maxsize=64)
+def weekend_bitmap(year: int, weekend: frozenset = WEEKEND_DAYS) -> int:
+    first = _year_start(year)
+    bitmap = 0
+    for offset in range((_year_start(year + 1) - first).days):
+        if (first + timedelta(days=offset)).weekday() in weekend:
+            bitmap |= 1 << offset
+    return bitmap
+
+
+class HolidayCalendar:
+    """Holidays as one integer bitmap per year, reloaded after ttl seconds and invalidated by create/delete_holiday."""
+
+    def __init__(self, ttl: float = HOLIDAY_CACHE_TTL, weekend=WEEKEND_DAYS):
+        self.ttl = ttl
+        self.weekend = frozenset(weekend)
+        self._lock = threading.Lock()
+        self._bitmaps = {}
+        self._names = {}
+        self._loaded_at = None
+        self.loads = 0
+
+    def load(self, db: Session):
+        bitmaps, names = {}, {}
+        for day, name in db.execute(select(models.Holiday.date, models.Holiday.name)):
+            bitmaps[day.year] = bitmaps.get(day.year, 0) | (1 << (day.timetuple().tm_yday - 1))
+            names[day] = name
+        with self._lock:
+            self._bitmaps, self._names = bitmaps, names
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def ensure(self, db: Session):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self.load(db)
+        return self
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def is_holiday(self, day: date) -> bool:
+        return bool(self._bitmaps.get(day.year, 0) >> (day.timetuple().tm_yday - 1) & 1)
+
+    def name(self, day: date):
+        return self._names.get(day)
+
+    def holidays_in_range(self, start: date, end: date) -> int:
+        """Number of holidays in [start, end)."""
+        return sum((self._bitmaps.get(year, 0) & mask).bit_count() for year, mask in _range_masks(start, end))
+
+    def holiday_dates(self, start: date, end: date):
+        """Holidays in [start, end), in date order."""
+        dates = []
+        for year, mask in _range_masks(start, end):
+            bits = self._bitmaps.get(year, 0) & mask
+            first = _year_start(year)
+            while bits:
+                low = bits & -bits
+                dates.append(first + timedelta(days=low.bit_length() - 1))
+                bits ^= low
+        return dates
+
+    def working_days(self, start: date, end: date, weekend=None) -> int:
+        """Days in [start, end) that are neither weekend days nor holidays."""
+        weekend = self.weekend if weekend is None else frozenset(weekend)
+        total = (end - start).days if end > start else 0
+        off = sum(
+            ((weekend_bitmap(year, weekend) | self._bitmaps.get(year, 0)) & mask).bit_count()
+            for year, mask in _range_masks(start, end)
+        )
+        return total - off
+
+    def stats(self):
+        loaded_at = self._loaded_at
+        return {
+            "years": len(self._bitmaps),
+            "holidays": len(self._names),
+            "loads": self.loads,
+            "age_seconds": round(time.monotonic() - loaded_at, 1) if loaded_at is not None else None,
+            "ttl_seconds": self.ttl,
+        }
+
+
+holidays = HolidayCalendar()
@@ -0,0 +1,401 @@
+"""
+Opt-in request instrumentation (INSTRUMENTATION=1): per-route latency, SQL and span timings on GET /metrics
+(bearer METRICS_TOKEN), slow-request logs and, with PROFILE_SLOW_REQUESTS=1, folded stacks in PROFILE_DIR.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+import functools
+import hmac
+import inspect
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from fastapi import Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in ("1", "true", "yes")
+
+
+INSTRUMENTATION = _env_flag("INSTRUMENTATION")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+PROFILE_SLOW_REQUESTS = _env_flag("PROFILE_SLOW_REQUESTS")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+# Statements run outside a request (location writer, compactor, startup) are labelled with this route.
+BACKGROUND_ROUTE = "background"
+
+logger = logging.getLogger(__name__)
+
+
+# Metric types
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, label_values=(), amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+
+    def observe(self, label_values, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, values)} {round(total, 6)}")
+                lines.append(f"{self.name}_count{_labels(self.labels, values)} {count}")
+        return lines
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "Request latency by route template.", ("method", "route", "status")
+)
+request_statements = Histogram(
+    "db_statements_per_request", "SQL statements run while serving one request.", ("route",), STATEMENT_COUNT_BUCKETS
+)
+statement_latency = Histogram(
+    "db_statement_duration_seconds", "SQL statement latency by the route that ran it.", ("route",)
+)
+span_latency = Histogram("span_duration_seconds", "Time spent inside named spans.", ("span",))
+slow_requests = Counter("http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS.", ("route",))
+METRICS = [request_latency, request_statements, statement_latency, span_latency, slow_requests]
+
+
+# Per-request state
+class RequestStats:
+    """What one request spent; shared by reference with the threadpool and greenlets serving it."""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = None
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        # Observed under the route template once the request is done; the raw path would explode the series.
+        self.sql_timings = []
+        self.spans = {}
+        self.threads = {threading.get_ident()}
+        self.samples = None
+
+    def add_span(self, name: str, seconds: float):
+        count, total = self.spans.get(name, (0, 0.0))
+        self.spans[name] = (count + 1, total + seconds)
+
+
+_current: ContextVar = ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+@contextmanager
+def _span(name: str):
+    stats = _current.get()
+    if stats is not None:
+        stats.threads.add(threading.get_ident())
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        span_latency.observe((name,), elapsed)
+        if stats is not None:
+            stats.add_span(name, elapsed)
+
+
+def span(name: str):
+    """Times the block as span name; free when instrumentation is off."""
+    return _span(name) if INSTRUMENTATION else nullcontext()
+
+
+def observe_span(name: str, seconds: float):
+    """Records a span measured elsewhere, e.g. work done in another process."""
+    if INSTRUMENTATION:
+        span_latency.observe((name,), seconds)
+
+
+def traced(fn, name: str):
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with _span(name):
+                return await fn(*args, **kwargs)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span(name):
+                return fn(*args, **kwargs)
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def trace_module(module, names=None):
+    """Replaces the module's public functions (or just names) with traced wrappers named module.function."""
+    prefix = module.__name__
+    for attr, value in list(vars(module).items()):
+        if names is not None and attr not in names:
+            continue
+        if names is None and (attr.startswith("_") or getattr(value, "__module__", None) != prefix):
+            continue
+        if inspect.isfunction(value) and not getattr(value, "__traced__", False):
+            setattr(module, attr, traced(value, f"{prefix}.{attr}"))
+
+
+# SQL timing
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("instrumentation_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["instrumentation_started"].pop()
+    elapsed = time.perf_counter() - started
+    stats = _current.get()
+    if stats is None:
+        statement_latency.observe((BACKGROUND_ROUTE,), elapsed)
+        return
+    stats.sql_count += 1
+    stats.sql_seconds += elapsed
+    stats.sql_timings.append(elapsed)
+    stats.threads.add(threading.get_ident())
+
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("instrumentation_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# Sampling profiler
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples every thread's stack while requests are profiled; each request keeps the samples of its own threads."""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self._cond = threading.Condition()
+        self._active = set()
+        self._thread = None
+
+    def begin(self, stats: RequestStats):
+        with self._cond:
+            stats.samples = {}
+            self._active.add(stats)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def end(self, stats: RequestStats):
+        with self._cond:
+            self._active.discard(stats)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+                frames = sys._current_frames()
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    folded = None
+                    for stats in self._active:
+                        if ident in stats.threads:
+                            folded = folded or _fold(frame)
+                            stats.samples[folded] = stats.samples.get(folded, 0) + 1
+                del frames
+            time.sleep(self.interval)
+
+
+sampler = StackSampler()
+
+
+def _dump_profile(stats: RequestStats, elapsed_ms: float) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", stats.route or stats.path).strip("_") or "root"
+    path = os.path.join(
+        PROFILE_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{stats.method}-{slug}-{int(elapsed_ms)}ms.folded"
+    )
+    with open(path, "w") as f:
+        for stack, count in sorted(stats.samples.items(), key=lambda item: -item[1]):
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+# Middleware
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["method"], scope["path"])
+        token = _current.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        if PROFILE_SLOW_REQUESTS:
+            sampler.begin(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            if PROFILE_SLOW_REQUESTS:
+                sampler.end(stats)
+            _current.reset(token)
+            route = scope.get("route")
+            stats.route = getattr(route, "path", None) or "unmatched"
+            self._record(stats, status_code, elapsed)
+
+    def _record(self, stats: RequestStats, status_code: int, elapsed: float):
+        request_latency.observe((stats.method, stats.route, str(status_code)), elapsed)
+        request_statements.observe((stats.route,), stats.sql_count)
+        for elapsed in stats.sql_timings:
+            statement_latency.observe((stats.route,), elapsed)
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < SLOW_REQUEST_MS:
+            return
+        slow_requests.inc((stats.route,))
+        spans = ", ".join(
+            f"{name}={total * 1000:.1f}ms/{count}"
+            for name, (count, total) in sorted(stats.spans.items(), key=lambda item: -item[1][1])
+        )
+        profile = _dump_profile(stats, elapsed_ms) if stats.samples else None
+        logger.warning(
+            "slow request %s %s: %.1fms, %d statements in %.1fms; spans: %s%s",
+            stats.method, stats.route, elapsed_ms, stats.sql_count, stats.sql_seconds * 1000,
+            spans or "none", f"; profile: {profile}" if profile else "",
+        )
+
+
+# /metrics
+def _stat_lines(collectors):
+    lines = [
+        "# HELP component_stat In-process cache, pool and queue counters.",
+        "# TYPE component_stat gauge",
+    ]
+
+    def walk(component, prefix, values):
+        for key, value in values.items():
+            name = f"{prefix}{key}"
+            if isinstance(value, dict):
+                walk(component, f"{name}_", value)
+            elif isinstance(value, (bool, int, float)):
+                lines.append(f"component_stat{_labels(('component', 'stat'), (component, name))} {float(value)}")
+
+    for component, collect in collectors.items():
+        try:
+            walk(component, "", collect())
+        except Exception:
+            logger.exception("stats collector %s failed", component)
+    return lines
+
+
+def render_metrics(collectors) -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(_stat_lines(collectors))
+    return "\n".join(lines) + "\n"
+
+
+def install(app, engines, modules=(), functions=(), collectors=None):
+    """engines are sync engines; modules and (module, name) functions get traced; collectors map names to stats callables."""
+    collectors = dict(collectors or {})
+    for engine in engines:
+        instrument_engine(engine)
+    for module in modules:
+        trace_module(module)
+    for module, name in functions:
+        trace_module(module, {name})
+    app.add_middleware(InstrumentationMiddleware)
+    if not METRICS_TOKEN:
+        logger.warning("METRICS_TOKEN is not set, /metrics is disabled")
+        return
+
+    def metrics(authorization: str = Header("")):
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+        return PlainTextResponse(render_metrics(collectors), media_type="text/plain; version=0.0.4")
+
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
@@ -0,0 +1,280 @@
+"""Batched GPS ingest. Points acknowledged without wait=true can be lost within LOCATION_FLUSH_INTERVAL_MS."""
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+import threading
+import time
+
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import database
+import location_store
+import models
+
+
+LOCATION_FLUSH_ROWS = int(os.getenv("LOCATION_FLUSH_ROWS", "500"))
+LOCATION_FLUSH_INTERVAL_MS = float(os.getenv("LOCATION_FLUSH_INTERVAL_MS", "1000"))
+LOCATION_BUFFER_MAX_ROWS = int(os.getenv("LOCATION_BUFFER_MAX_ROWS", "50000"))
+LOCATION_WAIT_TIMEOUT = float(os.getenv("LOCATION_WAIT_TIMEOUT", "30"))
+EMPLOYEE_ID_CACHE_TTL = float(os.getenv("EMPLOYEE_ID_CACHE_TTL", "60"))
+# An unknown id triggers a reload so new hires are accepted, but at most this often.
+EMPLOYEE_ID_MIN_RELOAD_SECONDS = 1.0
+FLUSH_RETRY_SECONDS = 1.0
+# After this many failed attempts a batch is written row by row and rows that still fail are dropped.
+LOCATION_FLUSH_MAX_ATTEMPTS = int(os.getenv("LOCATION_FLUSH_MAX_ATTEMPTS", "3"))
+DEAD_LETTER_KEEP = 1000
+# Client timestamps outside [now - max age, now + skew] are rejected: they would create stray
+# partitions and, from the future, pin latest_locations.
+LOCATION_MAX_CLOCK_SKEW_SECONDS = float(os.getenv("LOCATION_MAX_CLOCK_SKEW_SECONDS", "300"))
+LOCATION_MAX_AGE_DAYS = float(os.getenv("LOCATION_MAX_AGE_DAYS", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class EmployeeIdCache:
+    def __init__(self, ttl: float = EMPLOYEE_ID_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids = frozenset()
+        self._loaded_at = None
+        self.loads = 0
+
+    def load(self, db: Session):
+        ids = frozenset(db.scalars(select(models.EmployeeDB.id)))
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def add(self, employee_id: int):
+        with self._lock:
+            self._ids = self._ids | {employee_id}
+
+    def known(self, db: Session, employee_ids) -> frozenset:
+        """The subset of employee_ids that exist."""
+        loaded_at = self._loaded_at
+        age = time.monotonic() - loaded_at if loaded_at is not None else None
+        if age is None or age > self.ttl:
+            self.load(db)
+        elif not set(employee_ids) <= self._ids and age > EMPLOYEE_ID_MIN_RELOAD_SECONDS:
+            self.load(db)
+        return self._ids & set(employee_ids)
+
+
+employee_ids = EmployeeIdCache()
+
+
+class LocationWriter:
+    """Writes buffered location rows from one background thread; rows still failing after LOCATION_FLUSH_MAX_ATTEMPTS flushes are dead-lettered."""
+
+    def __init__(self, flush_rows: int = LOCATION_FLUSH_ROWS, flush_interval_ms: float = LOCATION_FLUSH_INTERVAL_MS,
+                 max_buffered: int = LOCATION_BUFFER_MAX_ROWS):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_buffered = max_buffered
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._oldest = None
+        self._waiters = 0
+        self._submitted = 0
+        self._resolved = 0
+        self._committed = 0
+        # Sequence numbers of dead-lettered rows (the most recent ones), for waiting requests.
+        self._dropped = deque(maxlen=DEAD_LETTER_KEEP)
+        self.dead_letter = deque(maxlen=DEAD_LETTER_KEEP)
+        self._closed = False
+        self._thread = None
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rejected = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = None
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="location-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, rows, wait: bool = False, timeout: float = None) -> bool:
+        """Queues rows; with wait (or a zero durability window) blocks until they are all committed."""
+        if not rows:
+            return True
+        wait = wait or self.flush_interval <= 0
+        with self._cond:
+            if self._closed:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Location ingest is shutting down")
+            if len(self._buffer) + len(rows) > self.max_buffered:
+                self.rejected += len(rows)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Location buffer is full, retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._start()
+            self._buffer.extend(rows)
+            self._submitted += len(rows)
+            target = self._submitted
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if not wait:
+                if len(self._buffer) >= self.flush_rows:
+                    self._cond.notify_all()
+                return False
+            self._waiters += 1
+            self._cond.notify_all()
+            try:
+                if not self._cond.wait_for(lambda: self._resolved >= target, timeout):
+                    return False
+            finally:
+                self._waiters -= 1
+            first = target - len(rows)
+            dropped = sorted(self._dropped)
+            index = bisect_left(dropped, first)
+            return index == len(dropped) or dropped[index] >= target
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if self._buffer and (self._closed or self._waiters or len(self._buffer) >= self.flush_rows):
+                    break
+                if self._closed:
+                    return None
+                if self._buffer:
+                    remaining = self._oldest + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            batch, self._buffer = self._buffer, []
+            self._oldest = None
+            return batch
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        with database.SessionLocal() as db:
+            location_store.store.insert_many(db, batch)
+            db.commit()
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def _write_rows(self, batch, first: int):
+        """Writes rows one at a time; returns (rows handled, sequence numbers of the dropped ones)."""
+        dropped = []
+        for index, row in enumerate(batch):
+            try:
+                self._write([row])
+            except OperationalError:
+                # The database is unavailable rather than the row being bad: retry from here later.
+                return index, dropped
+            except Exception:
+                logger.exception("dead-lettering location row %r", row)
+                dropped.append(first + index)
+                self.dead_letter.append(row)
+        return len(batch), dropped
+
+    def _run(self):
+        attempts = 0
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            first = self._resolved
+            dropped = []
+            if attempts < LOCATION_FLUSH_MAX_ATTEMPTS:
+                try:
+                    self._write(batch)
+                    handled = len(batch)
+                except Exception:
+                    logger.exception("location flush of %d rows failed", len(batch))
+                    handled = 0
+            else:
+                handled, dropped = self._write_rows(batch, first)
+            with self._cond:
+                self._resolved += handled
+                self._committed += handled - len(dropped)
+                self._dropped.extend(dropped)
+                self.dead_lettered += len(dropped)
+                if handled == len(batch):
+                    self.flushes += 1
+                else:
+                    self.failed_flushes += 1
+                    self._buffer[:0] = batch[handled:]
+                    self._oldest = time.monotonic()
+                closed = self._closed
+                self._cond.notify_all()
+            if handled == len(batch):
+                attempts = 0
+                continue
+            attempts += 1
+            if closed:
+                return
+            time.sleep(FLUSH_RETRY_SECONDS)
+
+    def close(self, timeout: float = 30):
+        """Flushes what is buffered and stops the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "buffered": len(self._buffer),
+                "submitted": self._submitted,
+                "committed": self._committed,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "rejected": self.rejected,
+                "dead_lettered": self.dead_lettered,
+                "last_flush_ms": self.last_flush_ms,
+                "flush_rows": self.flush_rows,
+                "flush_interval_ms": self.flush_interval * 1000,
+                "max_buffered": self.max_buffered,
+            }
+
+
+writer = LocationWriter()
+
+
+def _utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def ingest(db: Session, points, wait: bool = False):
+    """Validates a batch of LocationBatchPoint and queues the good ones; returns the counts and per-point errors."""
+    known = employee_ids.known(db, {p.employee_id for p in points})
+    now = datetime.utcnow()
+    earliest = now - timedelta(days=LOCATION_MAX_AGE_DAYS)
+    latest = now + timedelta(seconds=LOCATION_MAX_CLOCK_SKEW_SECONDS)
+    rows, errors = [], []
+    for index, point in enumerate(points):
+        if point.employee_id not in known:
+            errors.append({"index": index, "error": f"unknown employee_id {point.employee_id}"})
+            continue
+        timestamp = _utc_naive(point.timestamp) if point.timestamp else now
+        if timestamp > latest:
+            errors.append({"index": index, "error": "timestamp is in the future"})
+            continue
+        if timestamp < earliest:
+            errors.append({"index": index, "error": f"timestamp is older than {LOCATION_MAX_AGE_DAYS:g} days"})
+            continue
+        rows.append({
+            "employee_id": point.employee_id,
+            "latitude": point.latitude,
+            "longitude": point.longitude,
+            "accuracy": point.accuracy,
+            "source": point.source,
+            "timestamp": timestamp,
+        })
+    durable = writer.submit(rows, wait=wait, timeout=LOCATION_WAIT_TIMEOUT)
+    return {"accepted": len(rows), "rejected": len(errors), "durable": durable, "errors": errors}
@@ -0,0 +1,606 @@
+"""
+Month-partitioned location storage (location_logs_YYYYMM) plus each employee's latest ping.
+
+    python location_store.py migrate [--keep-legacy]
+    python location_store.py compact [--days N]
+    python location_store.py rebuild-latest
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import (
+    BigInteger, Column, DateTime, Float, Index, Integer, MetaData, SmallInteger, Table,
+    cast, column, delete, event, func, insert, literal, select, tuple_, update,
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import database
+import models
+import pagination
+
+
+COORD_SCALE = 10_000_000
+ACCURACY_SCALE = 100
+ID_SHIFT = 32
+LOCATION_PARTITION_CACHE_TTL = float(os.getenv("LOCATION_PARTITION_CACHE_TTL", "5"))
+LOCATION_COMPACT_AFTER_DAYS = float(os.getenv("LOCATION_COMPACT_AFTER_DAYS", "30"))
+LOCATION_COMPACT_INTERVAL_HOURS = float(os.getenv("LOCATION_COMPACT_INTERVAL_HOURS", "6"))
+COMPACT_DELETE_BATCH = 500
+MIGRATE_BATCH = 5000
+LATEST_UPSERT_BATCH = 1000
+LATEST_LOCATION_CACHE_TTL = float(os.getenv("LATEST_LOCATION_CACHE_TTL", "2"))
+LATEST_LOCATION_CACHE_SIZE = int(os.getenv("LATEST_LOCATION_CACHE_SIZE", "10000"))
+LATEST_COLUMNS = ("location_id", "lat_e7", "lon_e7", "accuracy_cm", "source_id", "timestamp")
+
+# Cursor key of history pages: (timestamp, encoded id), newest first.
+CURSOR_KEY = (column("timestamp", DateTime), column("id", BigInteger))
+
+logger = logging.getLogger(__name__)
+
+# Partition tables are created on demand, never by Base.metadata.create_all.
+partition_metadata = MetaData()
+_tables_lock = threading.Lock()
+
+
+def month_key(value: datetime) -> int:
+    return value.year * 100 + value.month
+
+
+def month_bounds(key: int):
+    year, month = divmod(key, 100)
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def encode_id(key: int, local_id: int) -> int:
+    return (key << ID_SHIFT) | local_id
+
+
+def decode_id(location_id: int):
+    return location_id >> ID_SHIFT, location_id & ((1 << ID_SHIFT) - 1)
+
+
+def partition_table(key: int) -> Table:
+    name = f"location_logs_{key}"
+    with _tables_lock:
+        table = partition_metadata.tables.get(name)
+        if table is None:
+            table = Table(
+                name, partition_metadata,
+                Column("id", Integer, primary_key=True),
+                Column("employee_id", Integer, nullable=False),
+                Column("lat_e7", Integer, nullable=False),
+                Column("lon_e7", Integer, nullable=False),
+                Column("accuracy_cm", Integer, nullable=True),
+                Column("source_id", SmallInteger, nullable=True),
+                Column("timestamp", DateTime, nullable=False),
+                Index(f"ix_{name}_employee_ts_id", "employee_id", "timestamp", "id"),
+                Index(f"ix_{name}_ts_id", "timestamp", "id"),
+            )
+        return table
+
+
+def _dialect_insert(conn, model):
+    # Like crud.dialect_insert, for a Connection.
+    if conn.dialect.name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+
+def _overlaps(key: int, start=None, end=None) -> bool:
+    month_start, month_end = month_bounds(key)
+    return (start is None or month_end > start) and (end is None or month_start <= end)
+
+
+_MISSING = object()
+
+
+class LatestLocationCache:
+    """Short-lived, LRU-bounded cache in front of latest_locations; a commit here drops the entries it touched."""
+
+    def __init__(self, ttl: float = LATEST_LOCATION_CACHE_TTL, max_size: int = LATEST_LOCATION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._snapshot = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, employee_id: int, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(employee_id)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(employee_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        value = loader()
+        if value is None:
+            return None
+        with self._lock:
+            if generation == self._generation:
+                self._entries[employee_id] = (now, value)
+                self._entries.move_to_end(employee_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def snapshot(self, loader):
+        now = time.monotonic()
+        with self._lock:
+            if self._snapshot is not None and now - self._snapshot[0] <= self.ttl:
+                self.hits += 1
+                return self._snapshot[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._snapshot = (now, value)
+        return value
+
+    def invalidate(self, employee_ids):
+        with self._lock:
+            self._generation += 1
+            for employee_id in employee_ids:
+                self._entries.pop(employee_id, None)
+
+    def invalidate_after_commit(self, db: Session, employee_ids):
+        """Invalidates once db commits, so no reader can cache the row being replaced."""
+        employee_ids = set(employee_ids)
+        event.listen(db, "after_commit", lambda session: self.invalidate(employee_ids), once=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl,
+            }
+
+
+class LocationStore:
+    def __init__(self, ttl: float = LOCATION_PARTITION_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._partitions = frozenset()
+        self._loaded_at = None
+        self._sources = {}
+        self.latest_cache = LatestLocationCache()
+
+    # Partitions
+    def partitions(self, db: Session):
+        """Month keys of the existing partitions, oldest first; the registry is re-read after ttl seconds."""
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            keys = frozenset(db.scalars(select(models.LocationPartition.month_key)))
+            with self._lock:
+                self._partitions = keys | self._partitions
+                self._loaded_at = time.monotonic()
+        return sorted(self._partitions)
+
+    def ensure_partition(self, key: int) -> Table:
+        table = partition_table(key)
+        if key in self._partitions:
+            return table
+        # DDL runs in its own short transaction so a rolled back insert never leaves a partition half made.
+        with database.engine.begin() as conn:
+            conn.execute(CreateTable(table, if_not_exists=True))
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+            conn.execute(
+                _dialect_insert(conn, models.LocationPartition)
+                .values(month_key=key, table_name=table.name, created_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=["month_key"])
+            )
+        with self._lock:
+            self._partitions = self._partitions | {key}
+        return table
+
+    def _source_id(self, name):
+        if name is None:
+            return None
+        source_id = self._sources.get(name)
+        if source_id is None:
+            sources = models.LocationSource.__table__
+            with database.engine.begin() as conn:
+                conn.execute(_dialect_insert(conn, models.LocationSource).values(name=name).on_conflict_do_nothing(
+                    index_elements=["name"]
+                ))
+                source_id = conn.scalar(select(sources.c.id).where(sources.c.name == name))
+            with self._lock:
+                self._sources[name] = source_id
+        return source_id
+
+    # Writes
+    def _encode(self, row):
+        accuracy = row.get("accuracy")
+        return {
+            "employee_id": row["employee_id"],
+            "lat_e7": round(row["latitude"] * COORD_SCALE),
+            "lon_e7": round(row["longitude"] * COORD_SCALE),
+            "accuracy_cm": round(accuracy * ACCURACY_SCALE) if accuracy is not None else None,
+            "source_id": self._source_id(row.get("source")),
+            "timestamp": row["timestamp"],
+        }
+
+    def insert_many(self, db: Session, rows):
+        """Inserts LocationCreate-shaped dicts (plus employee_id and timestamp), one executemany per month."""
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(month_key(row["timestamp"]), []).append(self._encode(row))
+        # Partitions are created before the first insert: on SQLite the DDL connection would wait on our own write lock.
+        tables = {key: self.ensure_partition(key) for key in by_month}
+        newest = {}
+        for key, encoded in by_month.items():
+            table = tables[key]
+            local_ids = db.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), encoded
+            ).scalars().all()
+            for values, local_id in zip(encoded, local_ids):
+                candidate = {**values, "location_id": encode_id(key, local_id)}
+                current = newest.get(values["employee_id"])
+                if current is None or (candidate["timestamp"], candidate["location_id"]) >= (current["timestamp"], current["location_id"]):
+                    newest[values["employee_id"]] = candidate
+        self.upsert_latest(db, list(newest.values()))
+
+    def insert_one(self, db: Session, row) -> int:
+        key = month_key(row["timestamp"])
+        table = self.ensure_partition(key)
+        values = self._encode(row)
+        local_id = db.execute(insert(table).values(**values).returning(table.c.id)).scalar_one()
+        self.upsert_latest(db, [{**values, "location_id": encode_id(key, local_id)}])
+        return encode_id(key, local_id)
+
+    def upsert_latest(self, db: Session, rows):
+        """Moves each employee's latest_locations row to the given ping unless it already holds a newer one."""
+        latest = models.LatestLocation.__table__
+        for offset in range(0, len(rows), LATEST_UPSERT_BATCH):
+            stmt = _dialect_insert(db.get_bind(), models.LatestLocation).values([
+                {"employee_id": row["employee_id"], **{c: row[c] for c in LATEST_COLUMNS}}
+                for row in rows[offset:offset + LATEST_UPSERT_BATCH]
+            ])
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["employee_id"],
+                set_={c: stmt.excluded[c] for c in LATEST_COLUMNS},
+                where=tuple_(stmt.excluded.timestamp, stmt.excluded.location_id) >= tuple_(latest.c.timestamp, latest.c.location_id)
+            ))
+        self.latest_cache.invalidate_after_commit(db, [row["employee_id"] for row in rows])
+
+    # Reads
+    def _decoded(self, key: int, table: Table):
+        sources = models.LocationSource.__table__
+        return select(
+            (literal(key << ID_SHIFT, BigInteger) + table.c.id).label("id"),
+            table.c.employee_id,
+            (cast(table.c.lat_e7, Float) / COORD_SCALE).label("latitude"),
+            (cast(table.c.lon_e7, Float) / COORD_SCALE).label("longitude"),
+            (cast(table.c.accuracy_cm, Float) / ACCURACY_SCALE).label("accuracy"),
+            sources.c.name.label("source"),
+            table.c.timestamp,
+        ).select_from(table.outerjoin(sources, sources.c.id == table.c.source_id))
+
+    def history_page(self, db: Session, employee_id, limit: int, cursor=None, start=None, end=None):
+        """Newest first across the partitions overlapping [start, end]; employee_id=None covers everyone."""
+        after = pagination.decode_cursor(cursor, CURSOR_KEY) if cursor else None
+        upper = end
+        if after is not None:
+            upper = min(end, after[0]) if end else after[0]
+
+        rows = []
+        for key in reversed(self.partitions(db)):
+            if not _overlaps(key, start, upper):
+                continue
+            table = partition_table(key)
+            stmt = self._decoded(key, table)
+            if employee_id is not None:
+                stmt = stmt.where(table.c.employee_id == employee_id)
+            if start:
+                stmt = stmt.where(table.c.timestamp >= start)
+            if end:
+                stmt = stmt.where(table.c.timestamp <= end)
+            if after is not None:
+                cursor_key, cursor_local_id = decode_id(after[1])
+                if key == cursor_key:
+                    stmt = stmt.where(tuple_(table.c.timestamp, table.c.id) < (after[0], cursor_local_id))
+            stmt = stmt.order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(limit + 1 - len(rows))
+            rows.extend(db.execute(stmt).all())
+            if len(rows) > limit:
+                break
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = pagination.encode_cursor(rows[-1].timestamp, rows[-1].id)
+        return rows, next_cursor
+
+    def _latest_select(self):
+        latest = models.LatestLocation.__table__
+        sources = models.LocationSource.__table__
+        return select(
+            latest.c.location_id.label("id"),
+            latest.c.employee_id,
+            (cast(latest.c.lat_e7, Float) / COORD_SCALE).label("latitude"),
+            (cast(latest.c.lon_e7, Float) / COORD_SCALE).label("longitude"),
+            (cast(latest.c.accuracy_cm, Float) / ACCURACY_SCALE).label("accuracy"),
+            sources.c.name.label("source"),
+            latest.c.timestamp,
+        ).select_from(latest.outerjoin(sources, sources.c.id == latest.c.source_id))
+
+    def _scan_latest(self, db: Session, employee_id: int):
+        for key in reversed(self.partitions(db)):
+            table = partition_table(key)
+            row = db.execute(
+                self._decoded(key, table)
+                .where(table.c.employee_id == employee_id)
+                .order_by(table.c.timestamp.desc(), table.c.id.desc())
+                .limit(1)
+            ).first()
+            if row is not None:
+                return row
+        return None
+
+    def latest(self, db: Session, employee_id: int):
+        """Primary-key lookup in latest_locations (cached); partitions are only scanned for employees without a row."""
+        def load():
+            row = db.execute(self._latest_select().where(models.LatestLocation.employee_id == employee_id)).first()
+            return row if row is not None else self._scan_latest(db, employee_id)
+        return self.latest_cache.get(employee_id, load)
+
+    def latest_all(self, db: Session):
+        """Every employee's current position from one read of latest_locations (cached)."""
+        return self.latest_cache.snapshot(
+            lambda: db.execute(self._latest_select().order_by(models.LatestLocation.employee_id)).all()
+        )
+
+    def rebuild_latest(self, db: Session):
+        """Refills latest_locations from the partitions, e.g. after restoring or hand-editing them."""
+        for key in self.partitions(db):
+            table = partition_table(key)
+            ranked = select(
+                table,
+                func.row_number().over(
+                    partition_by=table.c.employee_id,
+                    order_by=(table.c.timestamp.desc(), table.c.id.desc())
+                ).label("rank")
+            ).subquery()
+            rows = db.execute(select(ranked).where(ranked.c.rank == 1)).mappings().all()
+            self.upsert_latest(db, [{**row, "location_id": encode_id(key, row["id"])} for row in rows])
+            db.commit()
+        return db.query(models.LatestLocation).count()
+
+    def track(self, db: Session, employee_ids, start: datetime, end: datetime):
+        """(employee_id, latitude, longitude, timestamp) of the given employees in [start, end], by employee and time."""
+        rows = []
+        for key in self.partitions(db):
+            if not _overlaps(key, start, end):
+                continue
+            table = partition_table(key)
+            rows.extend(db.execute(select(
+                table.c.employee_id,
+                (cast(table.c.lat_e7, Float) / COORD_SCALE).label("latitude"),
+                (cast(table.c.lon_e7, Float) / COORD_SCALE).label("longitude"),
+                table.c.timestamp,
+            ).where(
+                table.c.employee_id.in_(list(employee_ids)),
+                table.c.timestamp >= start,
+                table.c.timestamp <= end
+            )).all())
+        rows.sort(key=lambda row: (row.employee_id, row.timestamp))
+        return rows
+
+    def export_statements(self, db: Session, employee_id=None, department_id=None, start=None, end=None):
+        """One SELECT per overlapping partition, oldest first; concatenated they are in timestamp order."""
+        statements = []
+        for key in self.partitions(db):
+            if not _overlaps(key, start, end):
+                continue
+            table = partition_table(key)
+            stmt = self._decoded(key, table)
+            if department_id is not None:
+                stmt = stmt.join(models.EmployeeDB, models.EmployeeDB.id == table.c.employee_id).where(
+                    models.EmployeeDB.department_id == department_id
+                )
+            if employee_id is not None:
+                stmt = stmt.where(table.c.employee_id == employee_id)
+            if start:
+                stmt = stmt.where(table.c.timestamp >= start)
+            if end:
+                stmt = stmt.where(table.c.timestamp <= end)
+            statements.append(stmt.order_by(table.c.timestamp, table.c.id))
+        return statements
+
+    # Compaction
+    def _compact_window(self, db: Session, key: int, table: Table, lo: datetime, hi: datetime):
+        """Compacts [lo, hi) one employee at a time, so memory is bounded by one employee's pings in the window."""
+        window = (table.c.timestamp >= lo, table.c.timestamp < hi)
+        employee_ids = db.scalars(select(table.c.employee_id).where(*window).distinct()).all()
+        # Pings that are some employee's latest position are never dropped.
+        pinned = {
+            decode_id(location_id)[1]
+            for location_id in db.scalars(select(models.LatestLocation.location_id).where(
+                models.LatestLocation.location_id >= encode_id(key, 0),
+                models.LatestLocation.location_id < encode_id(key + 1, 0)
+            ))
+        }
+
+        scanned = removed = 0
+        for employee_id in employee_ids:
+            rows = db.execute(select(
+                table.c.id, table.c.lat_e7, table.c.lon_e7, table.c.timestamp
+            ).where(
+                table.c.employee_id == employee_id, *window
+            ).order_by(table.c.timestamp, table.c.id)).all()
+            scanned += len(rows)
+
+            doomed = []
+            bucket, minute = [], None
+            for row in rows + [None]:
+                row_minute = None if row is None else row.timestamp.replace(second=0, microsecond=0)
+                if row_minute != minute:
+                    if len(bucket) > 1:
+                        # Keep the observed ping nearest the minute's centroid: the track keeps a real point, not an average.
+                        lat = sum(r.lat_e7 for r in bucket) / len(bucket)
+                        lon = sum(r.lon_e7 for r in bucket) / len(bucket)
+                        keep = min(bucket, key=lambda r: (r.lat_e7 - lat) ** 2 + (r.lon_e7 - lon) ** 2)
+                        doomed.extend(r.id for r in bucket if r is not keep and r.id not in pinned)
+                    bucket, minute = [], row_minute
+                if row is not None:
+                    bucket.append(row)
+
+            for offset in range(0, len(doomed), COMPACT_DELETE_BATCH):
+                db.execute(delete(table).where(table.c.id.in_(doomed[offset:offset + COMPACT_DELETE_BATCH])))
+            removed += len(doomed)
+        return scanned, removed
+
+    def compact(self, db: Session, older_than_days: float = LOCATION_COMPACT_AFTER_DAYS, now: datetime = None):
+        """Downsamples pings older than older_than_days to one per employee and minute, one day at a time."""
+        cutoff = ((now or datetime.utcnow()) - timedelta(days=older_than_days)).replace(second=0, microsecond=0)
+        registry = models.LocationPartition
+        result = {"partitions": 0, "rows_scanned": 0, "rows_removed": 0}
+        for partition in db.scalars(select(registry).order_by(registry.month_key)).all():
+            month_start, month_end = month_bounds(partition.month_key)
+            lo = partition.compacted_before or month_start
+            upto = min(cutoff, month_end)
+            if upto <= lo:
+                continue
+            table = partition_table(partition.month_key)
+            while lo < upto:
+                hi = min(lo + timedelta(days=1), upto)
+                scanned, removed = self._compact_window(db, partition.month_key, table, lo, hi)
+                partition.compacted_before = hi
+                db.commit()
+                result["rows_scanned"] += scanned
+                result["rows_removed"] += removed
+                lo = hi
+            result["partitions"] += 1
+        return result
+
+    # Migration
+    def _migrated_up_to(self, db: Session) -> int:
+        return db.scalar(select(models.LocationMigration.last_id).where(models.LocationMigration.id == 1)) or 0
+
+    def has_legacy_rows(self, db: Session) -> bool:
+        """True while location_logs has rows migrate_legacy() has not copied yet (rows without an employee stay behind)."""
+        legacy = models.LocationLog
+        return db.scalar(select(legacy.id).where(
+            legacy.id > self._migrated_up_to(db), legacy.employee_id.is_not(None)
+        ).limit(1)) is not None
+
+    def migrate_legacy(self, db: Session, batch_size: int = MIGRATE_BATCH, delete_legacy: bool = True):
+        """
+        Copies location_logs into the partitions in id order, batch by batch, past the high-water mark
+        in location_migration, so reruns and concurrent workers never copy a row twice.
+        Rows without an employee_id cannot be partitioned; they are counted as skipped and left in place.
+        """
+        legacy, mark = models.LocationLog, models.LocationMigration
+        db.execute(_dialect_insert(db.get_bind(), mark).values(id=1, last_id=0).on_conflict_do_nothing(index_elements=["id"]))
+        db.commit()
+        moved, skipped = 0, 0
+        while True:
+            last_id = self._migrated_up_to(db)
+            rows = db.execute(select(
+                legacy.id, legacy.employee_id, legacy.latitude, legacy.longitude,
+                legacy.accuracy, legacy.source, legacy.timestamp
+            ).where(legacy.id > last_id).order_by(legacy.id).limit(batch_size)).all()
+            if not rows:
+                db.rollback()
+                return {"rows_migrated": moved, "rows_skipped": skipped}
+            movable = [
+                {**row._asdict(), "timestamp": row.timestamp or datetime.utcnow()} for row in rows if row.employee_id is not None
+            ]
+            # Partitions and sources get their own connections, so make them before this session holds the write lock.
+            for row in movable:
+                self.ensure_partition(month_key(row["timestamp"]))
+                self._source_id(row["source"])
+            db.rollback()
+            claimed = db.execute(
+                update(mark).where(mark.id == 1, mark.last_id == last_id).values(last_id=rows[-1].id)
+            ).rowcount
+            if not claimed:
+                # Another process migrated this batch first.
+                db.rollback()
+                continue
+            self.insert_many(db, movable)
+            if delete_legacy:
+                db.execute(delete(legacy).where(
+                    legacy.id > last_id, legacy.id <= rows[-1].id, legacy.employee_id.is_not(None)
+                ))
+            db.commit()
+            moved += len(movable)
+            skipped += len(rows) - len(movable)
+
+store = LocationStore()
+
+
+class LocationCompactor:
+    """Runs store.compact every interval_hours on a daemon thread."""
+
+    def __init__(self, interval_hours: float = LOCATION_COMPACT_INTERVAL_HOURS,
+                 older_than_days: float = LOCATION_COMPACT_AFTER_DAYS):
+        self.interval = interval_hours * 3600
+        self.older_than_days = older_than_days
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_result = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="location-compactor", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with database.SessionLocal() as db:
+                    self.last_result = store.compact(db, self.older_than_days)
+            except Exception:
+                logger.exception("location compaction failed")
+
+    def stop(self):
+        self._stop.set()
+
+
+compactor = LocationCompactor()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the partitioned location store.")
+    parser.add_argument("command", choices=["migrate", "compact", "rebuild-latest"])
+    parser.add_argument("--keep-legacy", action="store_true", help="migrate: leave the rows in location_logs")
+    parser.add_argument("--days", type=float, default=LOCATION_COMPACT_AFTER_DAYS, help="compact: age threshold")
+    args = parser.parse_args(argv)
+
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        if args.command == "migrate":
+            result = store.migrate_legacy(db, delete_legacy=not args.keep_legacy)
+        elif args.command == "rebuild-latest":
+            result = {"latest_locations": store.rebuild_latest(db)}
+        else:
+            result = store.compact(db, args.days)
+    finally:
+        db.close()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,39 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, Query, status
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, BackgroundTasks, Depends, File, HTTPException, Header, Query, Response, UploadFile, status
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import false
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Union
 from jose import jwt, JWTError
+import anyio
 from uuid import uuid4, UUID
 from datetime import date, datetime  
 import os
 
 
+import attendance_import
 import auth
 import crud
 import database
+import exports
+import geofence
+import hashing
+import holiday_calendar
+import instrumentation
+import location_ingest
+import location_store
 import models
+import pagination
+import payslips
+import revocation
 import schema
 import utils
 
 
 
-from database import Base, engine, get_db
+from database import Base, engine, get_db, get_read_db, get_async_db
 from models import User, Role, EmployeeDB,LocationLog
 from schema import (
     UserCreate, UserOut, TokenResponse, RefreshRequest,
@@ -29,13 +43,14 @@ from schema import (
 from auth import (
     get_password_hash, verify_password,
     create_access_token, create_refresh_token, create_reset_token,
-    get_current_user, require_roles, blacklisted_refresh_tokens,
-    SECRET_KEY, ALGORITHM, authorize, get_user_roles
+    get_current_user, require_roles,
+    SECRET_KEY, ALGORITHM, authorize
 )
 from utils import validate_password
 
 
 Base.metadata.create_all(bind=engine)
+database.create_missing_indexes()
 
 app = FastAPI(title="Auth System with Roles")
 app.add_middleware(
@@ -47,6 +62,52 @@ app.add_middleware(
 )
 
 
+if instrumentation.INSTRUMENTATION:
+    instrumentation.install(
+        app,
+        engines=[database.engine, database.read_engine, database.async_engine.sync_engine],
+        modules=[crud],
+        collectors={
+            "principal_cache": auth.principal_cache.stats,
+            "revoked_tokens": revocation.revoked_tokens.stats,
+            "hashing": hashing.executor.stats,
+            "holiday_calendar": holiday_calendar.holidays.stats,
+            "payslip_cache": payslips.cache.stats,
+            "location_writer": location_ingest.writer.stats,
+            "latest_locations": location_store.store.latest_cache.stats,
+        },
+    )
+
+
+@app.on_event("shutdown")
+def shutdown_payslip_renderer():
+    payslips.renderer.shutdown()
+
+
+@app.on_event("shutdown")
+def flush_location_writer():
+    location_ingest.writer.close()
+    location_store.compactor.stop()
+
+
+@app.on_event("startup")
+async def size_request_threadpool():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = hashing.REQUEST_THREADS
+
+
+@app.on_event("startup")
+def migrate_legacy_locations():
+    # Reads only see the monthly partitions, so rows still in location_logs are moved before serving.
+    with database.SessionLocal() as db:
+        if location_store.store.has_legacy_rows(db):
+            location_store.store.migrate_legacy(db)
+
+
+@app.on_event("startup")
+def start_location_compactor():
+    location_store.compactor.start()
+
+
 @app.post("/signup", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 def signup(user: UserCreate, db: Session = Depends(get_db)):
     existing_user = db.query(User).filter(
@@ -64,41 +125,49 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
     if not role:
         role = Role(name=user.role.lower())
         db.add(role)
-        db.commit()
-        db.refresh(role)
     new_user.roles.append(role)
 
     db.add(new_user)
+    db.flush()
+    user_id = new_user.id
     db.commit()
-    db.refresh(new_user)
 
     return UserOut(
-        id=new_user.id,
-        username=new_user.username,
-        email=new_user.email,
-        roles=[r.name for r in new_user.roles]
+        id=user_id,
+        username=user.username,
+        email=user.email,
+        roles=[role.name]
     )
 
 
 @app.post("/login", response_model=TokenResponse)
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = auth.get_user(db, form_data.username)
     if not user or not verify_password(form_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    access_token = create_access_token({"sub": user.username, "roles": [r.name for r in user.roles]})
+    if auth.password_needs_rehash(user.hashed_password):
+        user.hashed_password = get_password_hash(form_data.password)
+        db.commit()
+
+    access_token = create_access_token({
+        "sub": user.username,
+        "uid": user.id,
+        "email": user.email,
+        "roles": [r.name for r in user.roles]
+    })
     refresh_token = create_refresh_token({"sub": user.username})
 
     return {"access_token": access_token, "refresh_token": refresh_token, "expires_in": 300}
 
 
 @app.post("/refresh", response_model=TokenResponse)
-def refresh_token(request: RefreshRequest):
+def refresh_token(request: RefreshRequest, db: Session = Depends(get_db)):
     try:
         payload = jwt.decode(request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
         if payload.get("type") != "refresh":
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-        if request.refresh_token in blacklisted_refresh_tokens:
+        if revocation.revoked_tokens.is_revoked(db, payload.get("jti", "")):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
         username = payload.get("sub")
     except JWTError:
@@ -109,18 +178,24 @@ def refresh_token(request: RefreshRequest):
 
 
 @app.post("/logout")
-def logout(request: RefreshRequest):
-    blacklisted_refresh_tokens.add(request.refresh_token)
+def logout(request: RefreshRequest, db: Session = Depends(get_db)):
+    try:
+        payload = jwt.decode(request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        # Expired or forged tokens are already unusable, there is nothing to revoke.
+        payload = None
+    if payload and payload.get("jti"):
+        revocation.revoked_tokens.revoke(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
     return {"msg": "Successfully logged out"}
 
 
 @app.get("/profile", response_model=UserOut)
-def profile(user: User = Depends(get_current_user)):
+def profile(user: auth.Principal = Depends(get_current_user)):
     return UserOut(
         id=user.id,
         username=user.username,
         email=user.email,
-        roles=[r.name for r in user.roles]
+        roles=user.roles
     )
 
 
@@ -148,30 +223,40 @@ def reset_password(request: ResetPasswordRequest, db: Session = Depends(get_db))
 
     user.hashed_password = get_password_hash(request.new_password)
     db.commit()
+    auth.invalidate_user(user.username)
     return {"msg": "Password reset successful"}
 
 
 
 @app.get("/admin-only")
-def admin_only(user: User = Depends(require_roles(["admin"]))):
+def admin_only(user: auth.Principal = Depends(require_roles(["admin"]))):
     return {"msg": f"Welcome Admin {user.username}!"}
 
 
 @app.get("/manager")
-def manager_or_admin(user: User = Depends(require_roles(["manager", "admin"]))):
+def manager_or_admin(user: auth.Principal = Depends(require_roles(["manager", "admin"]))):
     return {"msg": f"Hello {user.username}, you have manager/admin access"}
 
 
 @app.get("/hr")
-def hr_route(user: User = Depends(require_roles(["hr", "manager", "admin"]))):
+def hr_route(user: auth.Principal = Depends(require_roles(["hr", "manager", "admin"]))):
     return {"msg": f"Hello {user.username}, HR access granted"}
 
 
 @app.get("/employee")
-def employee_route(user: User = Depends(require_roles(["employee"]))):
+def employee_route(user: auth.Principal = Depends(require_roles(["employee"]))):
     return {"msg": f"Employee dashboard for {user.username}"}
 
 
+@app.get("/auth/stats")
+def auth_stats(user: auth.Principal = Depends(require_roles(["admin"]))):
+    return {
+        "principal_cache": auth.principal_cache.stats(),
+        "revoked_tokens": revocation.revoked_tokens.stats(),
+        "hashing": hashing.executor.stats()
+    }
+
+
 @app.get("/")
 def root():
     return {"msg": "User Auth API running"}
@@ -184,11 +269,10 @@ def create_employee(
     username: str = Header(...),
     db: Session = Depends(get_db)
 ):
-    authorize(username, "employee", "create", db)
-
-    creator = db.query(User).filter(User.username == username).first()
+    creator = auth.get_user(db, username)
     if not creator:
-        raise HTTPException(status_code=404, detail="Header username not found")
+        raise HTTPException(status_code=404, detail="User not found")
+    auth.check_policy(auth.role_masks.granted(r.name for r in creator.roles), "employee", "create")
 
     target_user = db.query(User).filter(User.id == req.user_id).first()
     if not target_user:
@@ -221,6 +305,7 @@ def create_employee(
     db.add(db_employee)
     db.commit()
     db.refresh(db_employee)
+    location_ingest.employee_ids.add(db_employee.id)
 
     try:
         db.add(models.AuditLog(action="EMPLOYEE_CREATED", user_id=creator.id))
@@ -244,21 +329,18 @@ def create_employee(
     )
 
 
-@app.get("/employees", response_model=List[EmployeeResponse])
+@app.get("/employees", response_model=schema.EmployeePage)
 def list_employees(
     username: str = Header(...),
-    skip: int = Query(0, ge=0),
-    limit: int = Query(10, ge=1),
+    limit: int = Query(10, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     is_active: Optional[bool] = None,
     db: Session = Depends(get_db)
 ):
     authorize(username, "employee", "view", db)
 
-    query = db.query(EmployeeDB)
-    if is_active is not None:
-        query = query.filter(EmployeeDB.is_active == is_active)
-    employees = query.offset(skip).limit(limit).all()
-    return employees
+    employees, next_cursor = crud.list_employees_page(db, limit, cursor, is_active)
+    return schema.EmployeePage(items=employees, next_cursor=next_cursor)
 
 
 @app.get("/employees/{user_id}", response_model=EmployeeResponse)
@@ -267,25 +349,26 @@ def get_employee_detail(user_id: int, username: str = Header(...), db: Session =
     if not employee:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee not found")
 
-    roles = get_user_roles(username, db)
-    if "admin" not in roles:
-        current = db.query(User).filter(User.username == username).first()
-        if not current or current.id != employee.user_id:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    caller = auth.get_user(db, username)
+    if not caller:
+        raise HTTPException(status_code=404, detail="User not found")
+    roles = [r.name for r in caller.roles]
+    if "admin" not in roles and caller.id != employee.user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
 
-    authorize(username, "employee", "view", db)
+    auth.check_policy(auth.role_masks.granted(roles), "employee", "view")
     return employee
 
 
 
 @app.post("/attendance/checkin", response_model=schema.AttendanceOut, status_code=status.HTTP_201_CREATED)
-def checkin(data: schema.AttendanceCreate, db: Session = Depends(get_db)):
-    return crud.check_in(db, data.user_id)
+async def checkin(data: schema.AttendanceCreate, db: AsyncSession = Depends(get_async_db)):
+    return await crud.async_check_in(db, data.user_id)
 
 
 @app.post("/attendance/checkout", response_model=schema.AttendanceOut)
-def checkout(data: schema.AttendanceCreate, db: Session = Depends(get_db)):
-    return crud.check_out(db, data.user_id)
+async def checkout(data: schema.AttendanceCreate, db: AsyncSession = Depends(get_async_db)):
+    return await crud.async_check_out(db, data.user_id)
 
 
 @app.post("/attendance/manual", response_model=schema.AttendanceOut)
@@ -299,11 +382,58 @@ def manual_update(
     return crud.manual_update(db, user_id, day, check_in, check_out)
 
 
+@app.post("/attendance/import", response_model=schema.AttendanceImportResult)
+def import_attendance(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    batch_size: int = Query(attendance_import.IMPORT_BATCH_SIZE, ge=1, le=10000),
+    current_user: auth.Principal = Depends(require_roles(["hr"])),
+    db: Session = Depends(get_db)
+):
+    """
+    Imports a badge reader dump (CSV with user_id,timestamp columns or NDJSON).
+    Rows that cannot be imported are reported individually; the rest are kept.
+    """
+    fmt = format or ("ndjson" if (file.filename or "").endswith((".ndjson", ".jsonl")) else "csv")
+    stream = attendance_import.text_stream(file.file)
+    return attendance_import.import_stream(db, stream, fmt, batch_size)
+
+
 @app.get("/attendance/report", response_model=Union[List[schema.AttendanceOut], schema.HolidayCreate])
-def report(day: date = Query(default=date.today()), db: Session = Depends(get_db)):
+def report(day: date = Query(default=date.today()), db: Session = Depends(get_read_db)):
     return crud.daily_report(db, day)
 
 
+@app.get("/attendance/verifications", response_model=List[schema.CheckinVerificationOut])
+def list_checkin_verifications(
+    day: date,
+    verdict: Optional[str] = Query(None, alias="status"),
+    current_user: auth.Principal = Depends(require_roles(["hr", "manager", "admin"])),
+    db: Session = Depends(get_read_db)
+):
+    return geofence.list_verifications(db, day, verdict)
+
+
+@app.post("/attendance/verifications/score", response_model=schema.CheckinScoreResult)
+def score_checkins(day: date, current_user: auth.Principal = Depends(require_roles(["admin"])), db: Session = Depends(get_db)):
+    return geofence.score_day(db, day)
+
+
+@app.post("/geofence/sites", response_model=schema.OfficeSiteOut, status_code=status.HTTP_201_CREATED)
+def create_office_site(site: schema.OfficeSiteCreate, current_user: auth.Principal = Depends(require_roles(["admin"])), db: Session = Depends(get_db)):
+    return geofence.create_site(db, site)
+
+
+@app.get("/geofence/sites", response_model=List[schema.OfficeSiteOut])
+def list_office_sites(current_user: auth.Principal = Depends(require_roles(["hr", "manager", "admin"])), db: Session = Depends(get_read_db)):
+    return db.query(models.OfficeSite).filter(models.OfficeSite.is_active.is_(True)).order_by(models.OfficeSite.id).all()
+
+
+@app.delete("/geofence/sites/{site_id}", response_model=schema.OfficeSiteOut)
+def deactivate_office_site(site_id: int, current_user: auth.Principal = Depends(require_roles(["admin"])), db: Session = Depends(get_db)):
+    return geofence.deactivate_site(db, site_id)
+
+
 @app.post("/attendance/holidays", response_model=schema.HolidayCreate, status_code=status.HTTP_201_CREATED)
 def add_holiday(data: schema.HolidayCreate, db: Session = Depends(get_db)):
     return crud.create_holiday(db, data)
@@ -314,8 +444,17 @@ def erase_holiday(data: schema.HolidayDelete, db: Session = Depends(get_db)):
     return crud.delete_holiday(db, data)
 
 
+@app.get("/attendance/summary/{year}/{month}", response_model=List[schema.UserAttendanceSummary])
+def attendance_summaries(year: int, month: int, department_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    summaries = crud.get_monthly_summaries(db, year, month, department_id)
+    return [
+        schema.UserAttendanceSummary(user_id=user_id, **summary.model_dump())
+        for user_id, summary in summaries.items()
+    ]
+
+
 @app.get("/attendance/summary/{user_id}/{year}/{month}", response_model=schema.AttendanceSummary)
-def attendance_summary(user_id: int, year: int, month: int, db: Session = Depends(get_db)):
+def attendance_summary(user_id: int, year: int, month: int, db: Session = Depends(get_read_db)):
     return crud.get_monthly_summary(db, user_id, year, month)
 
 
@@ -323,7 +462,7 @@ def attendance_summary(user_id: int, year: int, month: int, db: Session = Depend
 @app.post("/payroll/generate", response_model=schema.PayrollOut, status_code=status.HTTP_201_CREATED)
 def create_payroll(
     payload: schema.PayrollCreate,
-    current_user: models.User = Depends(auth.require_roles(["admin"])),
+    current_user: auth.Principal = Depends(auth.require_roles(["admin"])),
     db: Session = Depends(get_db)
 ):
     """
@@ -342,20 +481,86 @@ def create_payroll(
     return payroll_record
 
 
+@app.post("/payroll/run", response_model=schema.PayrollRunResult, status_code=status.HTTP_201_CREATED)
+def run_payroll(
+    payload: schema.PayrollRunCreate,
+    background_tasks: BackgroundTasks,
+    current_user: auth.Principal = Depends(auth.require_roles(["admin"])),
+    db: Session = Depends(get_db)
+):
+    """
+    Generates payroll for every active employee (optionally filtered by
+    department or employee ids) in a single transaction.
+    Employees that already have payroll for the period are skipped.
+    Payslips for the period are then pre-rendered in the background.
+    """
+    if payload.period_end < payload.period_start:
+        raise HTTPException(status_code=400, detail="period_end must not be before period_start")
+    result = crud.run_payroll(db, payload)
+
+    job = payslips.renderer.create_job(f"payroll run {payload.period_start}..{payload.period_end}", current_user.id)
+    background_tasks.add_task(payslips.pre_render_period, job.id, payload.period_start, payload.period_end)
+    result.payslip_job_id = job.id
+    return result
+
+
+@app.get("/payroll/payslips/archive")
+def payslip_archive(
+    period_start: date,
+    period_end: date,
+    department_id: Optional[int] = None,
+    current_user: auth.Principal = Depends(auth.require_roles(["admin"])),
+    db: Session = Depends(get_db)
+):
+    items = payslips.period_payslip_items(db, period_start, period_end, department_id)
+    if not items:
+        raise HTTPException(status_code=404, detail="No payroll found for this period")
+
+    filename = f"payslips_{period_start.isoformat()}_{period_end.isoformat()}"
+    if department_id is not None:
+        filename += f"_dept{department_id}"
+    return StreamingResponse(
+        payslips.stream_payslip_archive(items, f"archive {period_start}..{period_end}", current_user.id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.zip"'}
+    )
+
+
+@app.get("/payroll/payslip-cache")
+def payslip_cache_stats(current_user: auth.Principal = Depends(auth.require_roles(["admin"]))):
+    return payslips.cache.stats()
+
+
+@app.get("/payroll/payslip-jobs", response_model=List[schema.PayslipJobOut])
+def list_payslip_jobs(current_user: auth.Principal = Depends(auth.require_roles(["admin"]))):
+    return payslips.renderer.list_jobs()
+
+
+@app.get("/payroll/payslip-jobs/{job_id}", response_model=schema.PayslipJobOut)
+def get_payslip_job(job_id: str, current_user: auth.Principal = Depends(auth.get_current_user)):
+    job = payslips.renderer.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Payslip job not found")
+    if "admin" not in current_user.roles and current_user.id not in job.viewers:
+        raise HTTPException(status_code=403, detail="Not allowed to view this payslip job")
+    return job.as_dict()
+
 
 @app.get("/payroll/{employee_id}/payslip")
-def get_payslip(employee_id: int, period_start: date = None, period_end: date = None, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+def get_payslip(
+    employee_id: int,
+    period_start: date = None,
+    period_end: date = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
     emp = db.query(models.EmployeeDB).filter(models.EmployeeDB.id == employee_id).first()
     if not emp:
         raise HTTPException(status_code=404, detail="Employee not found")
         
-    user_roles = [r.name for r in current_user.roles]
-
-    if "admin" not in user_roles:
-        
-        current_emp = db.query(models.EmployeeDB).filter(models.EmployeeDB.user_id == current_user.id).first()
-        if not current_emp or current_emp.id != employee_id:
-            raise HTTPException(status_code=403, detail="Not allowed to view others' payslips")
+    if "admin" not in current_user.roles and emp.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not allowed to view others' payslips")
 
     if period_start and period_end:
         row = crud.get_payroll_for_employee(db, employee_id, period_start, period_end)
@@ -365,82 +570,155 @@ def get_payslip(employee_id: int, period_start: date = None, period_end: date =
     if not row:
         raise HTTPException(status_code=404, detail="Payroll not found")
 
-    pdf_path = utils.save_payslip_pdf(emp, row)
-    filename = os.path.basename(pdf_path)
-    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    # The ETag is the content hash of the payroll values, so a matching
+    # If-None-Match is answered without touching the disk.
+    data = utils.payslip_data(emp, row)
+    etag = f'W/"{utils.payslip_key(data)}"'
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    pdf_path = payslips.cache.lookup(utils.payslip_path(emp, row, data))
+    if pdf_path is None:
+        job = payslips.renderer.render(emp, row, data, current_user.id)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"msg": "Payslip is being rendered", "job_id": job.id, "status": job.status},
+            headers={"Location": f"/payroll/payslip-jobs/{job.id}", "Retry-After": "1"}
+        )
+
+    filename = f"payslip_{data['emp_code']}_{data['period_start']}_{data['period_end']}.pdf"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "ETag": etag}
     return FileResponse(path=pdf_path, media_type="application/pdf", headers=headers)
 
 
-@app.get("/payroll/summary")
-def payroll_summary(period_start: date, period_end: date, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    results = crud.list_payrolls_for_period(db, period_start, period_end)
-    user_roles = [r.name for r in current_user.roles]
+@app.get("/payroll/summary", response_model=List[schema.PayrollResponse])
+def payroll_summary(
+    period_start: date,
+    period_end: date,
+    department_id: Optional[int] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    if "admin" in current_user.roles:
+        return crud.list_payrolls_for_period(db, period_start, period_end, department_id=department_id)
+
+    current_emp_id = auth.current_employee_id(db, current_user)
+    if current_emp_id is None:
+        return []
+    return crud.list_payrolls_for_period(db, period_start, period_end, employee_id=current_emp_id)
 
-    if "admin" not in user_roles:
-        current_emp = db.query(models.EmployeeDB).filter(models.EmployeeDB.user_id == current_user.id).first()
-        if current_emp:
-            results = [r for r in results if r.employee_id == current_emp.id]
-        else:
-            results = []
 
-    return [{
-        "id": r.id,
-        "employee_id": r.employee_id,
-        "period_start": r.period_start,
-        "period_end": r.period_end,
-        "basic_salary": r.basic_salary,
-        "allowances": r.allowances,
-        "total_deductions": r.total_deductions,
-        "absent_days": r.absent_days,
-        "net_salary": r.net_salary,
-        "generated_at": r.generated_at
-    } for r in results]
+@app.get("/payroll/summary/departments", response_model=List[schema.PayrollDepartmentTotal])
+def payroll_department_totals(
+    period_start: date,
+    period_end: date,
+    current_user: auth.Principal = Depends(require_roles(["admin"])),
+    db: Session = Depends(get_read_db)
+):
+    return crud.payroll_totals_by_department(db, period_start, period_end)
+
+
+@app.get("/payroll/summary/export")
+def export_payroll_summary(
+    period_start: date,
+    period_end: date,
+    employee_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    if "admin" not in current_user.roles:
+        employee_id = auth.current_employee_id(db, current_user)
+        department_id = None
+        if employee_id is None:
+            statement = exports.payroll_export_statement(period_start, period_end).where(false())
+            return exports.export_response(statement, fmt, "payroll_summary")
 
+    statement = exports.payroll_export_statement(period_start, period_end, employee_id, department_id)
+    return exports.export_response(statement, fmt, f"payroll_summary_{period_start}_{period_end}")
 
 
 @app.post("/location/employee/{employee_id}", response_model=LocationOut)
-def save_location(employee_id: int, location: LocationCreate, db: Session = Depends(get_db)):
+async def save_location(employee_id: int, location: LocationCreate, db: AsyncSession = Depends(get_async_db)):
     
-    employee = db.query(EmployeeDB).filter(EmployeeDB.id == employee_id).first()
+    employee = await db.get(EmployeeDB, employee_id)
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
 
-    db_location = LocationLog(
-        employee_id=employee_id,
-        latitude=location.latitude,
-        longitude=location.longitude,
-        accuracy=location.accuracy,
-        source=location.source
-    )
-    db.add(db_location)
-    db.commit()
-    db.refresh(db_location)
-    return db_location
+    row = {
+        "employee_id": employee_id,
+        "latitude": location.latitude,
+        "longitude": location.longitude,
+        "accuracy": location.accuracy,
+        "source": location.source,
+        "timestamp": datetime.utcnow()
+    }
+    location_id = await db.run_sync(location_store.store.insert_one, row)
+    await db.commit()
+    return {**row, "id": location_id}
+
+
+@app.post("/location/batch", response_model=schema.LocationBatchResult, status_code=status.HTTP_202_ACCEPTED)
+def save_location_batch(batch: schema.LocationBatch, wait: bool = False, db: Session = Depends(get_read_db)):
+    """Points for any number of employees; wait=true returns only once they are committed."""
+    return location_ingest.ingest(db, batch.points, wait)
+
+
+@app.get("/location/ingest/stats")
+def location_ingest_stats(current_user: auth.Principal = Depends(require_roles(["admin"]))):
+    return {
+        "writer": location_ingest.writer.stats(),
+        "employee_ids_loaded": location_ingest.employee_ids.loads,
+        "latest_cache": location_store.store.latest_cache.stats(),
+    }
+
+
+@app.get("/location/history/{employee_id}", response_model=schema.LocationPage)
+def get_location_history(
+    employee_id: int,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    locations, next_cursor = crud.location_history_page(db, employee_id, limit, cursor, start, end)
+    return schema.LocationPage(items=locations, next_cursor=next_cursor)
 
 
-@app.get("/location/history/{employee_id}", response_model=List[LocationOut])
-def get_location_history(employee_id: int, start: Optional[datetime] = Query(None), end: Optional[datetime] = Query(None), db: Session = Depends(get_db)):
-    query = db.query(LocationLog).filter(LocationLog.employee_id == employee_id)
-    if start:
-        query = query.filter(LocationLog.timestamp >= start)
-    if end:
-        query = query.filter(LocationLog.timestamp <= end)
-    return query.order_by(LocationLog.timestamp.desc()).all()
+@app.get("/location/all", response_model=schema.LocationPage)
+def get_all_locations(
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    locations, next_cursor = crud.location_history_page(db, None, limit, cursor)
+    return schema.LocationPage(items=locations, next_cursor=next_cursor)
+
+
+@app.get("/location/export")
+def export_locations(
+    employee_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    current_user: auth.Principal = Depends(require_roles(["hr", "admin"])),
+    db: Session = Depends(get_read_db)
+):
+    statements = location_store.store.export_statements(db, employee_id, department_id, start, end)
+    return exports.export_response(statements, fmt, "locations")
 
 
-@app.get("/location/all", response_model=List[LocationOut])
-def get_all_locations(db: Session = Depends(get_db)):
-    return db.query(LocationLog).all()
+@app.get("/location/latest", response_model=List[schema.LatestLocationOut])
+def get_latest_locations(db: Session = Depends(get_read_db)):
+    return location_store.store.latest_all(db)
 
 
 @app.get("/location/latest/{employee_id}", response_model=LocationOut)
-def get_latest_location(employee_id: int, db: Session = Depends(get_db)):
-    location = (
-        db.query(LocationLog)
-        .filter(LocationLog.employee_id == employee_id)
-        .order_by(LocationLog.timestamp.desc())
-        .first()
-    )
+def get_latest_location(employee_id: int, db: Session = Depends(get_read_db)):
+    location = location_store.store.latest(db, employee_id)
     if not location:
         raise HTTPException(status_code=404, detail="No location found for this employee")
     return location
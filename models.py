@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Table, Date, Boolean, Numeric, Float
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, DateTime, ForeignKey, Table, Date, Boolean, Numeric, Float, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime, date
@@ -35,6 +35,10 @@ class Role(Base):
 
 class EmployeeDB(Base):
     __tablename__ = "employees"
+    # Keyset pagination of the directory, optionally filtered on is_active.
+    __table_args__ = (
+        Index("ix_employees_active_id", "is_active", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True)
     employee_code = Column(String, unique=True, index=True)
@@ -61,6 +65,10 @@ class EmployeeDB(Base):
 
 class Attendance(Base):
     __tablename__ = "attendance"
+    # One row per user per day; check-in/out rely on it for their single-statement upserts.
+    __table_args__ = (
+        Index("uq_attendance_user_date", "user_id", "date", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
     date = Column(Date, default=date.today)
@@ -76,6 +84,22 @@ class Holiday(Base):
     name = Column(String, nullable=False)
 
 
+class MonthlyAttendanceRollup(Base):
+    __tablename__ = "monthly_attendance_rollup"
+    # Materialized monthly summary, kept in step with attendance and holidays by crud in the same transaction.
+    __table_args__ = (
+        Index("uq_rollup_user_month", "user_id", "year", "month", unique=True),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    present = Column(Integer, nullable=False, default=0)
+    absent = Column(Integer, nullable=False, default=0)
+    holidays = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     id = Column(Integer, primary_key=True, index=True)
@@ -87,6 +111,10 @@ class AuditLog(Base):
 
 class Payroll(Base):
     __tablename__ = "payrolls"
+    # Covers per-employee period lookups and the duplicate check of a payroll run.
+    __table_args__ = (
+        Index("ix_payrolls_employee_period", "employee_id", "period_start", "period_end"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.id"))
     period_start = Column(Date, nullable=False)
@@ -104,6 +132,11 @@ class Payroll(Base):
 
 class LocationLog(Base):
     __tablename__ = "location_logs"
+    # (timestamp, id) is the keyset pagination key, per employee and across all employees.
+    __table_args__ = (
+        Index("ix_location_logs_employee_ts_id", "employee_id", "timestamp", "id"),
+        Index("ix_location_logs_ts_id", "timestamp", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.id"))
     latitude = Column(Float, nullable=False)
@@ -114,3 +147,93 @@ class LocationLog(Base):
 
     employee = relationship("EmployeeDB", back_populates="locations")
 
+
+
+class LocationSource(Base):
+    __tablename__ = "location_sources"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+
+
+class LocationPartition(Base):
+    # Registry of the monthly location_logs_YYYYMM tables created by location_store.
+    __tablename__ = "location_partitions"
+    id = Column(Integer, primary_key=True, index=True)
+    month_key = Column(Integer, unique=True, nullable=False)
+    table_name = Column(String, nullable=False)
+    compacted_before = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class LocationMigration(Base):
+    # High-water mark of location_store.migrate_legacy: location_logs ids up to last_id have been copied.
+    __tablename__ = "location_migration"
+    id = Column(Integer, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+
+
+class LatestLocation(Base):
+    # Newest ping per employee, upserted by location_store in the same transaction as the ping itself.
+    __tablename__ = "latest_locations"
+    employee_id = Column(Integer, ForeignKey("employees.id"), primary_key=True)
+    location_id = Column(BigInteger, nullable=False)
+    lat_e7 = Column(Integer, nullable=False)
+    lon_e7 = Column(Integer, nullable=False)
+    accuracy_cm = Column(Integer, nullable=True)
+    source_id = Column(SmallInteger, nullable=True)
+    timestamp = Column(DateTime, nullable=False)
+
+
+class OfficeSite(Base):
+    # Geofence: a circle (latitude/longitude/radius_m) or a polygon of [lat, lon] vertices stored as JSON.
+    # For polygons latitude/longitude is the vertex centroid and radius_m the circle that encloses all vertices.
+    __tablename__ = "office_sites"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    radius_m = Column(Float, nullable=False)
+    polygon = Column(String, nullable=True)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CheckinVerification(Base):
+    __tablename__ = "checkin_verifications"
+    __table_args__ = (
+        Index("uq_checkin_verification_user_date", "user_id", "date", unique=True),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    # inside | outside | stale | no_location
+    status = Column(String, nullable=False)
+    site_id = Column(Integer, ForeignKey("office_sites.id"), nullable=True)
+    distance_m = Column(Float, nullable=True)
+    location_id = Column(BigInteger, nullable=True)
+    ping_at = Column(DateTime, nullable=True)
+    verified_at = Column(DateTime, default=datetime.utcnow)
+    # Filled in by the batch scoring of the day's tracks.
+    track_points = Column(Integer, nullable=True)
+    track_inside = Column(Integer, nullable=True)
+    track_min_distance_m = Column(Float, nullable=True)
+    scored_at = Column(DateTime, nullable=True)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    # Workers sync on id > last seen id, so ids freed by pruning must never be handed out again.
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RevocationPrune(Base):
+    # One row per prune of revoked_tokens; workers rebuild their Bloom filter when the newest id changes.
+    __tablename__ = "revocation_prunes"
+    id = Column(Integer, primary_key=True)
+    rows_deleted = Column(Integer, nullable=False)
+    pruned_at = Column(DateTime, default=datetime.utcnow)
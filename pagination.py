@@ -0,0 +1,50 @@
+"""Keyset (cursor) pagination; the cursor is the url-safe base64 JSON of the last row's key."""
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(*values) -> str:
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(raw, list) or len(raw) != len(columns):
+            raise ValueError("wrong number of key values")
+        values = []
+        for column, value in zip(columns, raw):
+            python_type = column.type.python_type
+            values.append(datetime.fromisoformat(value) if python_type is datetime else python_type(value))
+        return tuple(values)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def keyset_page(query, columns, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE, descending: bool = False):
+    """
+    One page of query ordered by columns (which must form a unique key).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        after = decode_cursor(cursor, columns)
+        key = tuple_(*columns) if len(columns) > 1 else columns[0]
+        bound = after if len(columns) > 1 else after[0]
+        query = query.filter(key < bound if descending else key > bound)
+    query = query.order_by(*(c.desc() if descending else c.asc() for c in columns))
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*(getattr(rows[-1], c.key) for c in columns))
+    return rows, next_cursor
@@ -0,0 +1,147 @@
+from decimal import Decimal, ROUND_HALF_UP
+from numbers import Number
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the pure Python path gives identical results
+    np = None
+
+
+# Percentages are carried as integers in units of 1/10000 of a percent,
+# money as integer cents. All rounding is half-up to the cent, which is
+# what the Numeric(10, 2) payroll columns store.
+PERCENT_SCALE = 10_000
+DAYS_PER_MONTH = 30
+
+PAYROLL_COLUMNS = (
+    "basic_salary", "allowances", "deductions", "absent_deduction",
+    "total_deductions", "absent_days", "net_salary",
+)
+
+CENT = Decimal("0.01")
+
+
+def _column(values, n, convert=None):
+    if isinstance(values, (Number, Decimal)):
+        return [convert(values) if convert else values] * n
+    values = [convert(v) for v in values] if convert else list(values)
+    if len(values) != n:
+        raise ValueError("all payroll input columns must have the same length")
+    return values
+
+
+def _to_cents(value) -> int:
+    if isinstance(value, int):
+        return value * 100
+    return int(Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def _to_scaled_percent(value) -> int:
+    if isinstance(value, int):
+        return value * PERCENT_SCALE
+    return int((Decimal(str(value)) * PERCENT_SCALE).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _div_half_up(num: int, den: int) -> int:
+    q = (abs(num) * 2 + den) // (2 * den)
+    return q if num >= 0 else -q
+
+
+def _cents_to_decimal(cents: int) -> Decimal:
+    return Decimal(cents) * CENT
+
+
+def _fixed_point_python(basic, allow, ded, absent):
+    pct_den = 100 * PERCENT_SCALE
+    allowances = [_div_half_up(b * a, pct_den) for b, a in zip(basic, allow)]
+    deductions = [_div_half_up(b * d, pct_den) for b, d in zip(basic, ded)]
+    absent_deduction = [_div_half_up(b * n, DAYS_PER_MONTH) for b, n in zip(basic, absent)]
+    total = [d + a for d, a in zip(deductions, absent_deduction)]
+    net = [b + a - t for b, a, t in zip(basic, allowances, total)]
+    return allowances, deductions, absent_deduction, total, net
+
+
+def _fixed_point_numpy(basic, allow, ded, absent):
+    def div_half_up(num, den):
+        q = (np.abs(num) * 2 + den) // (2 * den)
+        return np.where(num >= 0, q, -q)
+
+    basic = np.asarray(basic, dtype=np.int64)
+    pct_den = 100 * PERCENT_SCALE
+    allowances = div_half_up(basic * np.asarray(allow, dtype=np.int64), pct_den)
+    deductions = div_half_up(basic * np.asarray(ded, dtype=np.int64), pct_den)
+    absent_deduction = div_half_up(basic * np.asarray(absent, dtype=np.int64), DAYS_PER_MONTH)
+    total = deductions + absent_deduction
+    net = basic + allowances - total
+    return [col.tolist() for col in (allowances, deductions, absent_deduction, total, net)]
+
+
+def _float_columns(basic, allow, ded, absent):
+    if np is not None:
+        basic = np.asarray(basic, dtype=np.float64)
+        allowances = basic * (np.asarray(allow, dtype=np.float64) / 100)
+        deductions = basic * (np.asarray(ded, dtype=np.float64) / 100)
+        absent_deduction = np.asarray(absent, dtype=np.float64) * (basic / DAYS_PER_MONTH)
+        total = deductions + absent_deduction
+        net = basic + allowances - total
+        return [col.tolist() for col in (basic, allowances, deductions, absent_deduction, total, net)]
+
+    basic = [float(b) for b in basic]
+    allowances = [b * (a / 100) for b, a in zip(basic, allow)]
+    deductions = [b * (d / 100) for b, d in zip(basic, ded)]
+    absent_deduction = [n * (b / DAYS_PER_MONTH) for b, n in zip(basic, absent)]
+    total = [d + a for d, a in zip(deductions, absent_deduction)]
+    net = [b + a - t for b, a, t in zip(basic, allowances, total)]
+    return basic, allowances, deductions, absent_deduction, total, net
+
+
+def compute_payroll_columns(basic_salary, allowances_percent, deductions_percent, absent_days, mode: str = "fixed"):
+    """Derived payroll columns for equal-length inputs (scalars broadcast); "fixed" works in cents, "float" is the legacy arithmetic."""
+    n = len(basic_salary)
+    absent = _column(absent_days, n, lambda a: int(a or 0))
+
+    if mode == "float":
+        basic, allowances, deductions, absent_deduction, total, net = _float_columns(
+            basic_salary, _column(allowances_percent, n, float), _column(deductions_percent, n, float), absent
+        )
+        return {
+            "basic_salary": basic,
+            "allowances": allowances,
+            "deductions": deductions,
+            "absent_deduction": absent_deduction,
+            "total_deductions": total,
+            "absent_days": absent,
+            "net_salary": net,
+        }
+
+    if mode != "fixed":
+        raise ValueError(f"unknown payroll engine mode: {mode}")
+
+    basic = [_to_cents(b) for b in basic_salary]
+    allow = _column(allowances_percent, n, _to_scaled_percent)
+    ded = _column(deductions_percent, n, _to_scaled_percent)
+    compute = _fixed_point_numpy if np is not None else _fixed_point_python
+    allowances, deductions, absent_deduction, total, net = compute(basic, allow, ded, absent)
+
+    return {
+        "basic_salary": list(map(_cents_to_decimal, basic)),
+        "allowances": list(map(_cents_to_decimal, allowances)),
+        "deductions": list(map(_cents_to_decimal, deductions)),
+        "absent_deduction": list(map(_cents_to_decimal, absent_deduction)),
+        "total_deductions": list(map(_cents_to_decimal, total)),
+        "absent_days": absent,
+        "net_salary": list(map(_cents_to_decimal, net)),
+    }
+
+
+def compute_payroll(basic_salary, allowances_percent, deductions_percent, absent_days, mode: str = "fixed"):
+    """Single-row convenience wrapper around compute_payroll_columns."""
+    columns = compute_payroll_columns(
+        [basic_salary], allowances_percent, deductions_percent, absent_days, mode=mode
+    )
+    return {name: values[0] for name, values in columns.items()}
+
+
+def iter_payroll_rows(columns):
+    """Yields one dict per employee from the columnar result."""
+    return (dict(zip(PAYROLL_COLUMNS, row)) for row in zip(*(columns[c] for c in PAYROLL_COLUMNS)))
@@ -0,0 +1,393 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, Optional
+import os
+import threading
+import time
+import uuid
+import zipfile
+
+from sqlalchemy.orm import Session
+
+import database
+import instrumentation
+import models
+import utils
+
+
+PAYSLIP_WORKERS = int(os.getenv("PAYSLIP_WORKERS", str(os.cpu_count() or 2)))
+MAX_TRACKED_JOBS = 200
+PAYSLIP_CACHE_MAX_BYTES = int(os.getenv("PAYSLIP_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+PAYSLIP_CACHE_MAX_AGE_DAYS = float(os.getenv("PAYSLIP_CACHE_MAX_AGE_DAYS", "90"))
+
+
+class PayslipCache:
+    """Evicting index of the rendered payslips under utils.OUTPUT_DIR, keyed by utils.payslip_key."""
+
+    def __init__(self, directory: str, max_bytes: int = PAYSLIP_CACHE_MAX_BYTES,
+                 max_age_days: float = PAYSLIP_CACHE_MAX_AGE_DAYS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._by_slot: Dict[str, str] = {}
+        self._size = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _parse(fname: str):
+        # payslip_<emp_code>_<start>_<end>_<key>.pdf ; the slot identifies the payslip regardless of its content
+        stem = fname[:-4]
+        slot, _, key = stem.rpartition("_")
+        if len(key) != 32:
+            return stem, stem
+        return slot, key
+
+    def _load(self):
+        if self._loaded:
+            return
+        entries = []
+        for item in os.scandir(self.directory):
+            if item.is_file() and item.name.endswith(".pdf"):
+                st = item.stat()
+                entries.append((st.st_mtime, item.path, st.st_size))
+        for mtime, path, size in sorted(entries):
+            self._add(path, size, mtime)
+        self._loaded = True
+        self._evict()
+
+    def _add(self, path: str, size: int, created: float):
+        slot, key = self._parse(os.path.basename(path))
+        previous = self._by_slot.get(slot)
+        if previous is not None and previous != key:
+            self._remove(previous)
+        if key in self._entries:
+            self._size -= self._entries[key]["size"]
+        self._entries[key] = {"path": path, "slot": slot, "size": size, "created": created}
+        self._entries.move_to_end(key)
+        self._by_slot[slot] = key
+        self._size += size
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry["size"]
+        if self._by_slot.get(entry["slot"]) == key:
+            del self._by_slot[entry["slot"]]
+        try:
+            os.remove(entry["path"])
+        except FileNotFoundError:
+            pass
+        self.evictions += 1
+
+    def _evict(self):
+        cutoff = time.time() - self.max_age
+        for key in [k for k, e in self._entries.items() if e["created"] < cutoff]:
+            self._remove(key)
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+
+    def add(self, path: str):
+        with self._lock:
+            self._load()
+            st = os.stat(path)
+            self._add(path, st.st_size, st.st_mtime)
+            self._evict()
+
+    def lookup(self, path: str) -> Optional[str]:
+        """Returns the cached file for this payslip path, or None if it still has to be rendered."""
+        _, key = self._parse(os.path.basename(path))
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None and os.path.exists(path):
+                st = os.stat(path)
+                self._add(path, st.st_size, st.st_mtime)
+                entry = self._entries[key]
+            if entry is None or not os.path.exists(entry["path"]):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["path"]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+cache = PayslipCache(utils.OUTPUT_DIR)
+
+
+class PayslipJob:
+    def __init__(self, description: str, owner_id: Optional[int] = None):
+        self.id = str(uuid.uuid4())
+        self.description = description
+        # Users allowed to read the job besides admins: its creator and anyone handed it for their payslip.
+        self.viewers = {owner_id} if owner_id is not None else set()
+        self.status = "queued"
+        self.total = 0
+        self.rendered = 0
+        self.skipped = 0
+        self.failed = 0
+        self.created_at = datetime.utcnow()
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @property
+    def pending(self):
+        return self.total - self.rendered - self.skipped - self.failed
+
+    def as_dict(self):
+        elapsed = None
+        if self.started is not None:
+            elapsed = (self.finished or time.perf_counter()) - self.started
+        return {
+            "job_id": self.id,
+            "description": self.description,
+            "status": self.status,
+            "total": self.total,
+            "rendered": self.rendered,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "pending": self.pending,
+            "created_at": self.created_at,
+            "elapsed_seconds": round(elapsed, 4) if elapsed is not None else None,
+            "payslips_per_second": round(self.rendered / elapsed, 2) if elapsed else 0.0,
+            "error": self.error,
+        }
+
+
+class PayslipRenderer:
+    """Renders payslip PDFs on a process pool and tracks their jobs in memory."""
+
+    def __init__(self, max_workers: int = PAYSLIP_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, PayslipJob]" = OrderedDict()
+        self._in_flight: Dict[str, str] = {}
+        self._futures: Dict[str, Future] = {}
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def create_job(self, description: str, owner_id: Optional[int] = None) -> PayslipJob:
+        job = PayslipJob(description, owner_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_TRACKED_JOBS:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[PayslipJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._lock:
+            return [job.as_dict() for job in reversed(self._jobs.values())]
+
+    def job_for_path(self, path: str) -> Optional[PayslipJob]:
+        with self._lock:
+            job_id = self._in_flight.get(path)
+            return self._jobs.get(job_id) if job_id else None
+
+    def submit(self, job: PayslipJob, items):
+        """Queues (path, data) pairs on the pool; files that already exist or are in flight are skipped."""
+        queued = []
+        with self._lock:
+            job.status = "running"
+            job.started = job.started or time.perf_counter()
+            for path, data in items:
+                job.total += 1
+                # Renders are moved into place when complete, so an existing file is a finished one.
+                if path in self._in_flight or os.path.exists(path):
+                    job.skipped += 1
+                    continue
+                # Registered before the render is queued, so wait() always finds an in-flight path.
+                done = Future()
+                self._in_flight[path] = job.id
+                self._futures[path] = done
+                queued.append((path, data, done))
+
+        for path, data, done in queued:
+            try:
+                future = self._pool().submit(utils.render_payslip_pdf, path, data)
+            except Exception as exc:
+                future = Future()
+                future.set_exception(exc)
+            future.add_done_callback(
+                lambda f, path=path, done=done, queued_at=time.perf_counter(): self._on_done(job, path, f, done, queued_at)
+            )
+        self._finish_if_done(job)
+        return job
+
+    def _on_done(self, job: PayslipJob, path: str, future, done: Future, queued_at: float):
+        instrumentation.observe_span("payslips.render", time.perf_counter() - queued_at)
+        error = future.exception()
+        if error is None:
+            try:
+                cache.add(path)
+            except OSError as exc:
+                error = exc
+        with self._lock:
+            self._in_flight.pop(path, None)
+            self._futures.pop(path, None)
+            if error is not None:
+                job.failed += 1
+                job.error = str(error)
+            else:
+                job.rendered += 1
+        if error is not None:
+            done.set_exception(error)
+        else:
+            done.set_result(path)
+        self._finish_if_done(job)
+
+    def _finish_if_done(self, job: PayslipJob):
+        with self._lock:
+            if job.status == "running" and job.pending == 0:
+                job.finished = time.perf_counter()
+                job.status = "failed" if job.failed else "completed"
+
+    def fail(self, job: PayslipJob, error: str):
+        with self._lock:
+            job.status = "failed"
+            job.error = error
+            job.finished = time.perf_counter()
+
+    def wait(self, path: str, timeout: Optional[float] = None) -> bool:
+        """Blocks until an in-flight render of path finishes; True if the file is there afterwards."""
+        with self._lock:
+            future = self._futures.get(path)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                return False
+        return os.path.exists(path)
+
+    def render(self, employee, payroll_row, data=None, owner_id: Optional[int] = None) -> PayslipJob:
+        data = data or utils.payslip_data(employee, payroll_row)
+        path = utils.payslip_path(employee, payroll_row, data)
+        job = self.job_for_path(path)
+        if job is not None:
+            if owner_id is not None:
+                with self._lock:
+                    job.viewers.add(owner_id)
+            return job
+        job = self.create_job(f"payslip {employee.id} {payroll_row.period_start}..{payroll_row.period_end}", owner_id)
+        return self.submit(job, [(path, data)])
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+renderer = PayslipRenderer()
+
+
+def period_payslip_items(db: Session, start: date, end: date, department_id: Optional[int] = None):
+    query = db.query(models.Payroll, models.EmployeeDB).join(
+        models.EmployeeDB, models.EmployeeDB.id == models.Payroll.employee_id
+    ).filter(
+        models.Payroll.period_start == start,
+        models.Payroll.period_end == end
+    )
+    if department_id is not None:
+        query = query.filter(models.EmployeeDB.department_id == department_id)
+    rows = query.order_by(models.Payroll.employee_id).all()
+    items = []
+    for row, emp in rows:
+        data = utils.payslip_data(emp, row)
+        items.append((utils.payslip_path(emp, row, data), data))
+    return items
+
+
+def pre_render_period(job_id: str, start: date, end: date):
+    """Background task run after a payroll run: queue every payslip of the period for rendering."""
+    job = renderer.get_job(job_id)
+    if job is None:
+        return
+    db = database.SessionLocal()
+    try:
+        renderer.submit(job, period_payslip_items(db, start, end))
+    except Exception as exc:
+        renderer.fail(job, str(exc))
+    finally:
+        db.close()
+
+
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+RENDER_WAIT_TIMEOUT = 120
+
+
+class _ZipSink:
+    """Write-only, unseekable file object; zipfile then emits data descriptors and never seeks back."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _archive_name(data):
+    return f"payslip_{data['emp_code']}_{data['period_start']}_{data['period_end']}.pdf"
+
+
+def stream_payslip_archive(items, description: str, owner_id: Optional[int] = None):
+    """Yields a ZIP of the (path, data) payslips chunk by chunk; failed renders are listed in MISSING.txt."""
+    ready, missing = [], []
+    for path, data in items:
+        (ready if cache.lookup(path) else missing).append((path, data))
+    if missing:
+        renderer.submit(renderer.create_job(description, owner_id), missing)
+
+    sink = _ZipSink()
+    failed = []
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for path, data in ready + missing:
+            if not renderer.wait(path, RENDER_WAIT_TIMEOUT):
+                failed.append(_archive_name(data))
+                continue
+            with open(path, "rb") as src, archive.open(_archive_name(data), "w", force_zip64=True) as dest:
+                while True:
+                    chunk = src.read(ARCHIVE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+        if failed:
+            archive.writestr("MISSING.txt", "\n".join(failed) + "\n")
+    yield sink.drain()
@@ -0,0 +1,123 @@
+from datetime import datetime
+import hashlib
+import math
+import os
+import threading
+import time
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import database
+from models import RevocationPrune, RevokedToken
+
+
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "1000000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.01"))
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "2"))
+REVOCATION_PRUNE_SECONDS = float(os.getenv("REVOCATION_PRUNE_SECONDS", "3600"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter; memory is set by capacity/error_rate, never by how many items are added."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationStore:
+    """Revoked jtis in revoked_tokens, fronted by a per-worker Bloom filter synced on id > last seen id."""
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY, error_rate: float = REVOCATION_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._last_id = 0
+        self._prune_id = None
+        self._synced_at = 0.0
+        self._pruned_at = time.monotonic()
+        self.bloom_negatives = 0
+        self.db_checks = 0
+
+    def _sync(self, db: Session, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._synced_at < REVOCATION_SYNC_SECONDS:
+            return
+        with self._lock:
+            if now - self._pruned_at >= REVOCATION_PRUNE_SECONDS:
+                self._prune(db)
+            prune_id = db.scalar(select(func.max(RevocationPrune.id)))
+            if prune_id != self._prune_id:
+                # Rows were pruned, here or by another worker: drop their jtis from the filter.
+                self._reset()
+                self._prune_id = prune_id
+            self._load(db)
+            self._synced_at = now
+
+    def _load(self, db: Session):
+        rows = db.execute(
+            select(RevokedToken.id, RevokedToken.jti).where(RevokedToken.id > self._last_id)
+        ).all()
+        for row_id, jti in rows:
+            self._bloom.add(jti)
+            self._last_id = max(self._last_id, row_id)
+
+    def _reset(self):
+        self._bloom = BloomFilter(self.capacity, self.error_rate)
+        self._last_id = 0
+
+    def _prune(self, db: Session):
+        deleted = db.execute(delete(RevokedToken).where(RevokedToken.expires_at < datetime.utcnow())).rowcount
+        if deleted:
+            db.execute(insert(RevocationPrune).values(rows_deleted=deleted))
+        db.commit()
+        self._pruned_at = time.monotonic()
+
+    def revoke(self, db: Session, jti: str, expires_at: datetime):
+        try:
+            db.execute(insert(RevokedToken).values(jti=jti, expires_at=expires_at))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        with self._lock:
+            self._bloom.add(jti)
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        self._sync(db)
+        if jti not in self._bloom:
+            self.bloom_negatives += 1
+            return False
+        self.db_checks += 1
+        return db.execute(
+            select(RevokedToken.id).where(RevokedToken.jti == jti)
+        ).first() is not None
+
+    def stats(self):
+        return {
+            "bloom_bits": self._bloom.num_bits,
+            "bloom_hashes": self._bloom.num_hashes,
+            "bloom_negatives": self.bloom_negatives,
+            "db_checks": self.db_checks,
+            "last_synced_id": self._last_id,
+        }
+
+
+revoked_tokens = RevocationStore()
+
@@ -0,0 +1,122 @@
+"""
+Backfills and checks monthly_attendance_rollup.
+
+    python rollup.py rebuild [--year Y --month M]
+    python rollup.py check [--year Y --month M] [--fix]
+"""
+import argparse
+import json
+import sys
+import time
+
+from sqlalchemy import extract, select, union
+from sqlalchemy.orm import Session
+
+import crud
+import database
+import models
+
+
+def rollup_months(db: Session, year: int = None, month: int = None):
+    """(year, month) pairs to process: the given one, or every month with attendance or rollup rows."""
+    if year is not None and month is not None:
+        return [(year, month)]
+    attendance_months = select(
+        extract("year", models.Attendance.date).label("year"),
+        extract("month", models.Attendance.date).label("month")
+    ).distinct()
+    rollup_rows = select(models.MonthlyAttendanceRollup.year, models.MonthlyAttendanceRollup.month).distinct()
+    months = sorted((int(y), int(m)) for y, m in db.execute(union(attendance_months, rollup_rows)))
+    if year is not None:
+        months = [(y, m) for y, m in months if y == year]
+    return months
+
+
+def _month_users(db: Session, year: int, month: int):
+    start, end = crud.month_range(year, month)
+    rollup = models.MonthlyAttendanceRollup
+    attended = select(models.Attendance.user_id).where(
+        models.Attendance.date >= start,
+        models.Attendance.date < end
+    )
+    rolled_up = select(rollup.user_id).where(rollup.year == year, rollup.month == month)
+    employees = select(models.EmployeeDB.user_id).where(
+        models.EmployeeDB.is_active.is_(True),
+        models.EmployeeDB.user_id.is_not(None)
+    )
+    return sorted(db.scalars(union(attended, rolled_up, employees)))
+
+
+def rebuild(db: Session, year: int = None, month: int = None):
+    """Recomputes every rollup row of the selected months, one grouped query per month."""
+    started = time.perf_counter()
+    months = rollup_months(db, year, month)
+    rows = 0
+    for y, m in months:
+        user_ids = _month_users(db, y, m)
+        crud.store_rollups(db, y, m, crud.attendance_summaries(db, user_ids, *crud.month_range(y, m)))
+        db.commit()
+        rows += len(user_ids)
+    return {
+        "months": len(months),
+        "rows_written": rows,
+        "elapsed_seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+def check(db: Session, year: int = None, month: int = None, fix: bool = False):
+    """Compares stored rollup rows with a recount; with fix=True the mismatching rows are rewritten."""
+    rollup = models.MonthlyAttendanceRollup
+    checked, mismatches = 0, []
+    for y, m in rollup_months(db, year, month):
+        stored = {
+            row.user_id: row
+            for row in db.scalars(select(rollup).where(rollup.year == y, rollup.month == m))
+        }
+        if not stored:
+            continue
+        expected = crud.attendance_summaries(db, sorted(stored), *crud.month_range(y, m))
+        stale = {}
+        for user_id, row in stored.items():
+            checked += 1
+            want = expected[user_id]
+            have = (row.present, row.absent, row.holidays)
+            if have != (want.present_days, want.absent_days, want.holidays):
+                stale[user_id] = want
+                mismatches.append({
+                    "user_id": user_id,
+                    "year": y,
+                    "month": m,
+                    "stored": dict(zip(("present", "absent", "holidays"), have)),
+                    "expected": {"present": want.present_days, "absent": want.absent_days, "holidays": want.holidays},
+                })
+        if fix and stale:
+            crud.store_rollups(db, y, m, stale)
+            db.commit()
+    return {"rows_checked": checked, "mismatches": mismatches, "fixed": fix and bool(mismatches)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild or verify the monthly attendance rollup.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--month", type=int)
+    parser.add_argument("--fix", action="store_true", help="check: rewrite mismatching rows")
+    args = parser.parse_args(argv)
+
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            result = rebuild(db, args.year, args.month)
+        else:
+            result = check(db, args.year, args.month, args.fix)
+    finally:
+        db.close()
+
+    print(json.dumps(result, indent=2))
+    return 1 if result.get("mismatches") and not result["fixed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, model_validator
 from typing import List, Optional
 from uuid import UUID
 from datetime import date,datetime
@@ -65,6 +65,11 @@ class EmployeeResponse(EmployeeBase):
         from_attributes = True
 
 
+class EmployeePage(BaseModel):
+    items: List[EmployeeResponse]
+    next_cursor: Optional[str] = None
+
+
 class AttendanceCreate(BaseModel):
     user_id: int
 
@@ -77,6 +82,19 @@ class AttendanceOut(BaseModel):
     class Config:
         from_attributes = True
 
+class AttendanceImportError(BaseModel):
+    line: int
+    error: str
+
+class AttendanceImportResult(BaseModel):
+    rows_read: int
+    punches_accepted: int
+    rows_rejected: int
+    attendance_rows_upserted: int
+    elapsed_seconds: float
+    rows_per_second: float
+    errors: List[AttendanceImportError]
+
 class HolidayCreate(BaseModel):
     date: date
     name: str
@@ -91,6 +109,9 @@ class AttendanceSummary(BaseModel):
     absent_days: int
     holidays: int
 
+class UserAttendanceSummary(AttendanceSummary):
+    user_id: int
+
 class PayrollCreate(BaseModel):
     employee_id: int
     period_start: date
@@ -100,6 +121,25 @@ class PayrollCreate(BaseModel):
     deductions_percent: Optional[float] = 10.0
     absent_days: Optional[int] = 0
 
+class PayrollRunCreate(BaseModel):
+    period_start: date
+    period_end: date
+    department_id: Optional[int] = None
+    employee_ids: Optional[List[int]] = None
+    allowances_percent: Optional[float] = 20.0
+    deductions_percent: Optional[float] = 10.0
+
+class PayrollRunResult(BaseModel):
+    period_start: date
+    period_end: date
+    employees_considered: int
+    created: int
+    skipped_duplicates: int
+    skipped_missing_salary: int
+    elapsed_seconds: float
+    rows_per_second: float
+    payslip_job_id: Optional[str] = None
+
 class PayrollOut(BaseModel):
     id: int
     employee_id: int
@@ -117,6 +157,16 @@ class PayrollOut(BaseModel):
     class Config:
         from_attributes = True
 
+class PayrollDepartmentTotal(BaseModel):
+    department_id: Optional[int] = None
+    employees: int
+    payrolls: int
+    basic_salary: float
+    allowances: float
+    total_deductions: float
+    absent_days: int
+    net_salary: float
+
 class PayrollResponse(BaseModel):
     id: int
     employee_id: int
@@ -133,6 +183,21 @@ class PayrollResponse(BaseModel):
         from_attributes = True
 
 
+class PayslipJobOut(BaseModel):
+    job_id: str
+    description: str
+    status: str
+    total: int
+    rendered: int
+    skipped: int
+    failed: int
+    pending: int
+    created_at: datetime
+    elapsed_seconds: Optional[float] = None
+    payslips_per_second: float
+    error: Optional[str] = None
+
+
 class LocationCreate(BaseModel):
     latitude: float
     longitude: float
@@ -148,4 +213,92 @@ class LocationOut(BaseModel):
     timestamp: datetime
 
     class Config:
-        from_attributes = True       
+        from_attributes = True
+
+
+class OfficeSiteCreate(BaseModel):
+    name: str
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    radius_m: Optional[float] = Field(None, gt=0, le=50_000)
+    # [[lat, lon], ...]; when given, latitude/longitude/radius_m are derived from it.
+    polygon: Optional[List[List[float]]] = None
+
+    @model_validator(mode="after")
+    def check_shape(self):
+        if self.polygon is not None:
+            if len(self.polygon) < 3 or any(len(v) != 2 for v in self.polygon):
+                raise ValueError("polygon needs at least 3 [lat, lon] vertices")
+        elif None in (self.latitude, self.longitude, self.radius_m):
+            raise ValueError("give latitude, longitude and radius_m, or a polygon")
+        return self
+
+
+class OfficeSiteOut(BaseModel):
+    id: int
+    name: str
+    kind: str
+    latitude: float
+    longitude: float
+    radius_m: float
+    polygon: Optional[str] = None
+    is_active: bool
+
+    class Config:
+        from_attributes = True
+
+
+class CheckinVerificationOut(BaseModel):
+    user_id: int
+    date: date
+    status: str
+    site_id: Optional[int] = None
+    distance_m: Optional[float] = None
+    location_id: Optional[int] = None
+    ping_at: Optional[datetime] = None
+    verified_at: Optional[datetime] = None
+    track_points: Optional[int] = None
+    track_inside: Optional[int] = None
+    track_min_distance_m: Optional[float] = None
+    scored_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class CheckinScoreResult(BaseModel):
+    date: date
+    checkins: int
+    scored: int
+    points: int
+    elapsed_seconds: float
+
+
+class LatestLocationOut(LocationOut):
+    employee_id: int
+
+
+class LocationBatchPoint(LocationCreate):
+    employee_id: int
+    timestamp: Optional[datetime] = None
+
+
+class LocationBatch(BaseModel):
+    points: List[LocationBatchPoint] = Field(max_length=10000)
+
+
+class LocationBatchError(BaseModel):
+    index: int
+    error: str
+
+
+class LocationBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    durable: bool
+    errors: List[LocationBatchError]
+
+
+class LocationPage(BaseModel):
+    items: List[LocationOut]
+    next_cursor: Optional[str] = None       
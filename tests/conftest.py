@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import time
+
+# database.py reads DATABASE_URL at import time, so point it at a scratch file first.
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    import main
+
+    with TestClient(main.app) as client:
+        for username, role in (("admin", "admin"), ("staff", "employee")):
+            client.post("/signup", json={
+                "username": username, "email": f"{username}@example.com", "password": "pw", "role": role
+            })
+        for user_id in (1, 2):
+            client.post("/employees", headers={"username": "admin"}, json={
+                "user_id": user_id, "first_name": f"F{user_id}", "last_name": "L",
+                "email": f"e{user_id}@example.com", "phone_number": "1234567890",
+                "department_id": user_id, "role": "employee",
+                "date_of_joining": "2024-01-01", "salary": 30000,
+            })
+        yield client
+
+
+@pytest.fixture(scope="session")
+def bearer(client):
+    def headers(username):
+        token = client.post("/login", data={"username": username, "password": "pw"}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return headers
+
+
+@pytest.fixture
+def kolkata(monkeypatch):
+    """Server-local time is UTC+05:30."""
+    monkeypatch.setenv("TZ", "Asia/Kolkata")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
@@ -0,0 +1,16 @@
+def test_check_in_and_check_out_once_a_day(client):
+    # User 2 has no attendance today; user 1 is checked in by the rollup test.
+    checkout = client.post("/attendance/checkout", json={"user_id": 2})
+    assert checkout.status_code == 404
+    assert checkout.json()["detail"] == "No check-in record found for today."
+
+    assert client.post("/attendance/checkin", json={"user_id": 2}).status_code == 201
+    again = client.post("/attendance/checkin", json={"user_id": 2})
+    assert again.status_code == 409
+    assert again.json()["detail"] == "You have already checked in today."
+
+    first = client.post("/attendance/checkout", json={"user_id": 2})
+    assert first.status_code == 200 and first.json()["check_out"] is not None
+    second = client.post("/attendance/checkout", json={"user_id": 2})
+    assert second.status_code == 409
+    assert second.json()["detail"] == "You have already checked out today."
@@ -0,0 +1,40 @@
+import io
+from datetime import datetime
+
+import attendance_import
+
+
+def _csv(data: bytes):
+    return list(attendance_import.parse_csv(attendance_import.text_stream(io.BytesIO(data))))
+
+
+def test_csv_punches_are_parsed_and_offsets_converted_to_local_time(kolkata):
+    rows = _csv(b"user_id,timestamp\n1,2024-03-01T09:00:00\n2,2024-03-01T09:30:00+05:30\n3,2024-03-01T18:00:00Z\n")
+    assert rows == [
+        (2, 1, datetime(2024, 3, 1, 9, 0)),
+        (3, 2, datetime(2024, 3, 1, 9, 30)),
+        (4, 3, datetime(2024, 3, 1, 23, 30)),
+    ]
+
+
+def test_bad_csv_lines_are_reported_without_stopping_the_file():
+    rows = _csv(b"user_id,timestamp\n1,yesterday\n,2024-03-01T09:00:00\n\xff\xfe,2024-03-01T09:00:00\n2,2024-03-01T10:00:00\n")
+    assert [r[0] for r in rows] == [2, 3, 4, 5]
+    assert [r[1] for r in rows] == [None, None, None, 2]
+    assert rows[2][2] == "line is not valid UTF-8"
+
+
+def test_malformed_csv_reports_its_line():
+    oversized = b'2,"' + b"x" * 200_000 + b'"\n'
+    rows = _csv(b"user_id,timestamp\n" + oversized + b"3,2024-03-01T10:00:00\n")
+    assert rows[0][0] == 2 and rows[0][1] is None and rows[0][2].startswith("malformed CSV")
+    assert rows[1] == (3, 3, datetime(2024, 3, 1, 10, 0))
+
+
+def test_ndjson_skips_blank_lines_and_reports_bad_ones():
+    stream = attendance_import.text_stream(io.BytesIO(
+        b'{"user_id": 1, "timestamp": "2024-03-01T09:00:00"}\n\n[1, 2]\n{"user_id": 2}\n'
+    ))
+    rows = list(attendance_import.parse_ndjson(stream))
+    assert rows[0] == (1, 1, datetime(2024, 3, 1, 9, 0))
+    assert [(r[0], r[1]) for r in rows[1:]] == [(3, None), (4, None)]
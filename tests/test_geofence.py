@@ -0,0 +1,88 @@
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import database
+import geofence
+import location_store
+import models
+import schema
+
+
+SQUARE = [[13.0, 77.0], [13.0, 77.01], [13.01, 77.01], [13.01, 77.0]]
+NOTCHED = [[0, 0], [0, 4], [4, 4], [4, 0], [2, 2]]
+
+
+@pytest.mark.parametrize("lat, lon, inside", [
+    (13.005, 77.005, True),
+    (13.011, 77.005, False),
+    (12.999, 77.005, False),
+    (13.005, 77.0101, False),
+])
+def test_point_in_square(lat, lon, inside):
+    assert geofence.point_in_polygon(lat, lon, SQUARE) is inside
+
+
+def test_point_in_concave_polygon():
+    assert geofence.point_in_polygon(1, 3, NOTCHED)
+    assert not geofence.point_in_polygon(2, 1, NOTCHED)
+
+
+def test_haversine_known_distances():
+    assert geofence.haversine_m(0, 0, 0, 0) == 0
+    assert geofence.haversine_m(0, 0, 0, 1) == pytest.approx(111_195, rel=1e-4)
+    assert geofence.haversine_m(12.97, 77.59, 12.98, 77.59) == pytest.approx(1_112, rel=1e-3)
+
+
+def test_haversine_matrix_matches_scalar(monkeypatch):
+    points = [(12.97, 77.59), (13.0, 77.0), (-33.86, 151.2)]
+    sites = [(12.971, 77.591), (13.005, 77.005)]
+    expected = [[geofence.haversine_m(lat, lon, slat, slon) for slat, slon in sites] for lat, lon in points]
+    args = ([p[0] for p in points], [p[1] for p in points], [s[0] for s in sites], [s[1] for s in sites])
+    assert [list(row) for row in geofence.haversine_matrix(*args)] == [pytest.approx(row) for row in expected]
+    monkeypatch.setattr(geofence, "np", None)
+    assert geofence.haversine_matrix(*args) == [pytest.approx(row) for row in expected]
+
+
+def _fence(site_id, **columns):
+    return geofence.Fence(models.OfficeSite(id=site_id, name=f"site {site_id}", **columns))
+
+
+def test_index_finds_the_nearest_containing_fence():
+    index = geofence.FenceIndex([
+        _fence(1, kind="radius", latitude=12.97, longitude=77.59, radius_m=200),
+        _fence(2, kind="radius", latitude=12.9705, longitude=77.5905, radius_m=50),
+        _fence(3, kind="polygon", latitude=13.005, longitude=77.005, radius_m=800, polygon=json.dumps(SQUARE)),
+    ])
+    assert index.locate(12.9705, 77.5905)[0].site_id == 2
+    assert index.locate(12.9715, 77.59)[0].site_id == 1
+    assert index.locate(13.005, 77.005)[0].site_id == 3
+    assert index.locate(13.011, 77.0) == (None, None)
+
+
+def test_oversized_fences_are_not_spread_over_the_grid():
+    index = geofence.FenceIndex([_fence(1, kind="radius", latitude=10, longitude=20, radius_m=5_000_000)], max_cells=64)
+    assert not index._cells
+    assert index.locate(11, 21)[0].site_id == 1
+
+
+def test_score_day_matches_local_check_ins_to_utc_pings(client, kolkata):
+    db = database.SessionLocal()
+    site = geofence.create_site(db, schema.OfficeSiteCreate(name="HQ", latitude=12.97, longitude=77.59, radius_m=200))
+    try:
+        day = date(2024, 5, 10)
+        # 09:00 in Kolkata is 03:30 UTC.
+        db.add(models.Attendance(user_id=1, date=day, check_in=datetime(2024, 5, 10, 9, 0)))
+        location_store.store.insert_many(db, [
+            {"employee_id": 1, "latitude": 12.97, "longitude": 77.59, "source": "gps",
+             "timestamp": datetime(2024, 5, 10, 3, 20) + timedelta(minutes=5 * i)}
+            for i in range(5)
+        ])
+        db.commit()
+        assert geofence.score_day(db, day)["points"] == 5
+        verification = db.query(models.CheckinVerification).filter_by(user_id=1, date=day).one()
+        assert (verification.track_points, verification.track_inside) == (5, 5)
+    finally:
+        geofence.deactivate_site(db, site.id)
+        db.close()
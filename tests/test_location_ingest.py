@@ -0,0 +1,118 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError
+
+import database
+import location_ingest
+
+
+def test_batch_rejects_timestamps_out_of_range(client):
+    now = datetime.utcnow()
+    points = [
+        {"employee_id": 1, "latitude": 1, "longitude": 2, "source": "gps", "timestamp": "9999-12-31T23:59:00"},
+        {"employee_id": 1, "latitude": 1, "longitude": 2, "source": "gps", "timestamp": "0001-01-01T00:00:00"},
+        {"employee_id": 1, "latitude": 1, "longitude": 2, "source": "gps", "timestamp": (now + timedelta(hours=1)).isoformat()},
+        {"employee_id": 1, "latitude": 1, "longitude": 2, "source": "gps", "timestamp": (now - timedelta(minutes=5)).isoformat()},
+        {"employee_id": 1, "latitude": 1, "longitude": 2, "source": "gps"},
+    ]
+    result = client.post("/location/batch", params={"wait": "true"}, json={"points": points}).json()
+    assert (result["accepted"], result["rejected"], result["durable"]) == (2, 3, True)
+    assert [e["index"] for e in result["errors"]] == [0, 1, 2]
+    assert result["errors"][0]["error"] == "timestamp is in the future"
+    tables = inspect(database.engine).get_table_names()
+    assert "location_logs_999912" not in tables and "location_logs_101" not in tables
+    latest = client.get("/location/latest/1").json()
+    assert datetime.fromisoformat(latest["timestamp"]) <= now + timedelta(seconds=5)
+
+
+def _rows(n, start=0):
+    return [{"employee_id": 1, "latitude": 0.0, "longitude": 0.0, "seq": start + i} for i in range(n)]
+
+
+def _until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def recording_writer(monkeypatch):
+    monkeypatch.setattr(location_ingest, "FLUSH_RETRY_SECONDS", 0.01)
+    writers = []
+
+    def make(fail=lambda batch: None, **kwargs):
+        writer = location_ingest.LocationWriter(**kwargs)
+        writer.batches = []
+
+        def write(batch):
+            fail(batch)
+            writer.batches.append([row["seq"] for row in batch])
+
+        writer._write = write
+        writers.append(writer)
+        return writer
+
+    yield make
+    for writer in writers:
+        writer.close()
+
+
+def test_writer_flushes_full_batches_and_after_the_interval(recording_writer):
+    writer = recording_writer(flush_rows=3, flush_interval_ms=60_000)
+    assert writer.submit(_rows(2)) is False
+    time.sleep(0.05)
+    assert writer.batches == []
+    writer.submit(_rows(1, start=2))
+    _until(lambda: writer.batches)
+    assert writer.batches == [[0, 1, 2]]
+
+    writer = recording_writer(flush_rows=100, flush_interval_ms=20)
+    writer.submit(_rows(1))
+    _until(lambda: writer.batches)
+    assert writer.stats()["committed"] == 1
+
+
+def test_wait_returns_once_the_rows_are_committed(recording_writer):
+    writer = recording_writer(flush_rows=100, flush_interval_ms=60_000)
+    assert writer.submit(_rows(2), wait=True, timeout=5) is True
+    assert writer.batches == [[0, 1]]
+    assert writer.submit([]) is True
+
+
+def test_transient_errors_are_retried(recording_writer):
+    failures = [OperationalError("INSERT", {}, Exception("database is locked"))] * 2
+
+    def fail(batch):
+        if failures:
+            raise failures.pop()
+
+    writer = recording_writer(fail, flush_rows=100, flush_interval_ms=60_000)
+    assert writer.submit(_rows(3), wait=True, timeout=5) is True
+    assert writer.batches == [[0, 1, 2]]
+    assert (writer.failed_flushes, writer.dead_lettered) == (2, 0)
+
+
+def test_poison_rows_are_dead_lettered(recording_writer):
+    def fail(batch):
+        if any(row["seq"] == 1 for row in batch):
+            raise ValueError("bad row")
+
+    writer = recording_writer(fail, flush_rows=100, flush_interval_ms=60_000)
+    assert writer.submit(_rows(3), wait=True, timeout=5) is False
+    assert writer.batches == [[0], [2]]
+    assert [row["seq"] for row in writer.dead_letter] == [1]
+    assert writer.failed_flushes == location_ingest.LOCATION_FLUSH_MAX_ATTEMPTS
+    assert writer.submit(_rows(1, start=3), wait=True, timeout=5) is True
+
+
+def test_full_buffer_is_a_429(recording_writer):
+    writer = recording_writer(flush_rows=100, flush_interval_ms=60_000, max_buffered=2)
+    writer.submit(_rows(2))
+    with pytest.raises(HTTPException) as exc:
+        writer.submit(_rows(1))
+    assert exc.value.status_code == 429
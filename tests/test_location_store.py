@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+import database
+import location_store
+import models
+
+
+def test_migrate_legacy_copies_each_row_once(client):
+    db = database.SessionLocal()
+    try:
+        start = datetime(2023, 6, 1, 8)
+        db.add_all([
+            models.LocationLog(employee_id=1 + i % 2, latitude=12.5, longitude=77.5, source="gps",
+                               timestamp=start + timedelta(minutes=i))
+            for i in range(7)
+        ] + [models.LocationLog(employee_id=None, latitude=1, longitude=1, timestamp=start)])
+        db.commit()
+        assert location_store.store.has_legacy_rows(db)
+
+        first = location_store.store.migrate_legacy(db, batch_size=3, delete_legacy=False)
+        again = location_store.store.migrate_legacy(db, batch_size=3, delete_legacy=False)
+        assert first == {"rows_migrated": 7, "rows_skipped": 1}
+        assert again == {"rows_migrated": 0, "rows_skipped": 0}
+        assert not location_store.store.has_legacy_rows(db)
+        assert db.query(models.LocationLog).count() == 8
+    finally:
+        db.close()
+
+    history = client.get("/location/history/1", params={
+        "start": "2023-06-01T00:00:00", "end": "2023-06-02T00:00:00", "limit": 50
+    }).json()
+    assert len(history["items"]) == 4
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import models
+import pagination
+
+
+KEY = [models.LocationLog.timestamp, models.LocationLog.id]
+
+
+def test_cursor_round_trips_the_key():
+    cursor = pagination.encode_cursor(datetime(2024, 3, 1, 9, 30, 15, 250), 42)
+    assert "=" not in cursor
+    assert pagination.decode_cursor(cursor, KEY) == (datetime(2024, 3, 1, 9, 30, 15, 250), 42)
+
+
+def test_single_column_cursor():
+    cursor = pagination.encode_cursor(7)
+    assert pagination.decode_cursor(cursor, [models.EmployeeDB.id]) == (7,)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!",
+    pagination.encode_cursor(1),
+    pagination.encode_cursor("yesterday", 1),
+    pagination.encode_cursor(None, 1),
+])
+def test_bad_cursors_are_a_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        pagination.decode_cursor(cursor, KEY)
+    assert exc.value.status_code == 400
@@ -0,0 +1,58 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+import payroll_engine
+
+
+def _batch(n=500):
+    rng = random.Random(7)
+    basic = [rng.choice([rng.randrange(10_000, 200_000), round(rng.uniform(10_000, 200_000), 2)]) for _ in range(n)]
+    allowances = [round(rng.uniform(0, 40), 3) for _ in range(n)]
+    deductions = [round(rng.uniform(0, 25), 3) for _ in range(n)]
+    absent = [rng.choice([None, 0, 1, 3, 7, 30]) for _ in range(n)]
+    return basic, allowances, deductions, absent
+
+
+@pytest.mark.parametrize("mode", ["fixed", "float"])
+def test_numpy_and_pure_python_agree(monkeypatch, mode):
+    if payroll_engine.np is None:
+        pytest.skip("numpy not installed")
+    batch = _batch()
+    with_numpy = payroll_engine.compute_payroll_columns(*batch, mode=mode)
+    monkeypatch.setattr(payroll_engine, "np", None)
+    pure = payroll_engine.compute_payroll_columns(*batch, mode=mode)
+    if mode == "fixed":
+        assert with_numpy == pure
+    else:
+        for column in payroll_engine.PAYROLL_COLUMNS:
+            assert with_numpy[column] == pytest.approx(pure[column])
+
+
+def test_fixed_mode_rounds_half_up_to_the_cent():
+    row = payroll_engine.compute_payroll(30_000, 12.5, 8.25, 1)
+    assert row == {
+        "basic_salary": Decimal("30000.00"),
+        "allowances": Decimal("3750.00"),
+        "deductions": Decimal("2475.00"),
+        "absent_deduction": Decimal("1000.00"),
+        "total_deductions": Decimal("3475.00"),
+        "absent_days": 1,
+        "net_salary": Decimal("30275.00"),
+    }
+    assert payroll_engine.compute_payroll(100.01, 0.5, 0, 0)["allowances"] == Decimal("0.50")
+
+
+def test_scalars_are_broadcast_and_rows_iterate_in_order():
+    columns = payroll_engine.compute_payroll_columns([1000, 2000], 10, 0, [None, 3])
+    rows = list(payroll_engine.iter_payroll_rows(columns))
+    assert [r["allowances"] for r in rows] == [Decimal("100.00"), Decimal("200.00")]
+    assert [r["absent_days"] for r in rows] == [0, 3]
+
+
+def test_mismatched_columns_and_unknown_mode_are_rejected():
+    with pytest.raises(ValueError):
+        payroll_engine.compute_payroll_columns([1000, 2000], [10], 0, 0)
+    with pytest.raises(ValueError):
+        payroll_engine.compute_payroll(1000, 10, 0, 0, mode="decimal")
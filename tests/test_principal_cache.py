@@ -0,0 +1,62 @@
+import auth
+import models
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+CLAIMS = {"sub": "alice", "uid": 1, "roles": ["employee"]}
+
+
+def test_claims_are_compared_with_the_invalidation_in_whole_seconds(monkeypatch):
+    cache = auth.PrincipalCache()
+    monkeypatch.setattr(auth.time, "time", Clock(1000.7))
+    assert cache.claims_trusted({**CLAIMS, "iat": 1000})
+    cache.invalidate_user("alice")
+    assert not cache.claims_trusted({**CLAIMS, "iat": 1000})
+    assert cache.claims_trusted({**CLAIMS, "iat": 1001})
+    assert cache.claims_trusted({**CLAIMS, "sub": "bob", "iat": 1000})
+
+
+def test_role_claims_and_cached_principals_expire_after_the_ttl(monkeypatch):
+    clock = Clock(1000)
+    monkeypatch.setattr(auth.time, "time", clock)
+    cache = auth.PrincipalCache(ttl=30)
+    cache.put(auth.Principal.from_claims({**CLAIMS, "jti": "a", "exp": 1300}), from_claims=True)
+    clock.now = 1029
+    assert cache.claims_trusted({**CLAIMS, "iat": 1000})
+    assert cache.get("a") is not None
+    clock.now = 1031
+    assert not cache.claims_trusted({**CLAIMS, "iat": 1000})
+    assert cache.get("a") is None
+
+
+def test_user_masks_are_reloaded_after_the_ttl(monkeypatch):
+    clock = Clock(0)
+    monkeypatch.setattr(auth.time, "monotonic", clock)
+    roles = [["employee"]]
+    monkeypatch.setattr(auth, "get_user_roles", lambda username, db: roles[-1])
+    masks = auth.UserMaskCache(ttl=30)
+    employee = masks.get("alice", None)
+    roles.append(["admin"])
+    clock.now = 30
+    assert masks.get("alice", None) == employee
+    clock.now = 31
+    assert masks.get("alice", None) == auth.role_masks.granted(["admin"])
+
+
+def test_claims_without_roles_are_not_trusted():
+    assert not auth.PrincipalCache().claims_trusted({"sub": "alice", "iat": 1000})
+
+
+def test_creating_a_user_does_not_invalidate_it(monkeypatch):
+    calls = []
+    monkeypatch.setattr(auth, "invalidate_user", calls.append)
+    user = models.User(username="carol", email="carol@example.com", hashed_password="x")
+    user.roles.append(models.Role(name="employee"))
+    assert calls == []
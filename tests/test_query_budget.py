@@ -0,0 +1,49 @@
+import pytest
+
+from database import QueryBudgetExceeded, QueryCounter
+
+
+SUMMARY = {"period_start": "2024-03-01", "period_end": "2024-03-31"}
+
+
+def test_employee_detail_budget(client):
+    with QueryCounter(budget=2):
+        assert client.get("/employees/2", headers={"username": "admin"}).status_code == 200
+    with QueryCounter(budget=2):
+        assert client.get("/employees/2", headers={"username": "staff"}).status_code == 403
+
+
+def test_login_budget(client):
+    with QueryCounter(budget=1):
+        assert client.post("/login", data={"username": "staff", "password": "pw"}).status_code == 200
+
+
+def test_profile_budget(client, bearer):
+    headers = bearer("staff")
+    with QueryCounter(budget=0):
+        assert client.get("/profile", headers=headers).status_code == 200
+
+
+def test_profile_budget_right_after_signup(client, bearer):
+    # Login usually lands in the same second as signup, which must not force a DB lookup.
+    for i in range(5):
+        client.post("/signup", json={
+            "username": f"fresh{i}", "email": f"fresh{i}@example.com", "password": "pw", "role": "employee"
+        })
+        headers = bearer(f"fresh{i}")
+        with QueryCounter(budget=0):
+            assert client.get("/profile", headers=headers).status_code == 200
+
+
+def test_payroll_summary_budget(client, bearer):
+    admin, staff = bearer("admin"), bearer("staff")
+    with QueryCounter(budget=1):
+        assert client.get("/payroll/summary", headers=admin, params=SUMMARY).status_code == 200
+    with QueryCounter(budget=2):
+        assert client.get("/payroll/summary", headers=staff, params=SUMMARY).status_code == 200
+
+
+def test_counter_fails_over_budget(client):
+    with pytest.raises(QueryBudgetExceeded):
+        with QueryCounter(budget=1):
+            client.get("/employees/2", headers={"username": "admin"})
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+
+import database
+import revocation
+
+
+def test_workers_share_revocations_and_rebuild_after_a_prune(client):
+    db = database.SessionLocal()
+    a, b = revocation.RevocationStore(capacity=1000), revocation.RevocationStore(capacity=1000)
+    try:
+        a.revoke(db, "expired-jti", datetime.utcnow() - timedelta(minutes=1))
+        a.revoke(db, "live-jti", datetime.utcnow() + timedelta(days=1))
+        b._sync(db, force=True)
+        assert b.is_revoked(db, "live-jti") and b.is_revoked(db, "expired-jti")
+        assert not b.is_revoked(db, "never-revoked")
+
+        a._prune(db)
+        b._sync(db, force=True)
+        assert "expired-jti" not in b._bloom
+        assert b.is_revoked(db, "live-jti")
+        assert not b.is_revoked(db, "expired-jti")
+
+        # Nothing pruned since: a sync only reads rows past the last seen id.
+        last_id = b._last_id
+        a.revoke(db, "later-jti", datetime.utcnow() + timedelta(days=1))
+        b._sync(db, force=True)
+        assert b._last_id > last_id and "live-jti" in b._bloom and b.is_revoked(db, "later-jti")
+    finally:
+        db.close()
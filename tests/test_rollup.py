@@ -0,0 +1,54 @@
+import io
+from datetime import date
+
+import attendance_import
+import database
+import rollup
+
+
+def _manual(client, user_id, day, check_in="09:00", check_out="17:00"):
+    response = client.post("/attendance/manual", params={
+        "user_id": user_id, "day": day, "check_in": f"{day}T{check_in}:00", "check_out": f"{day}T{check_out}:00"
+    })
+    assert response.status_code == 200
+
+
+def _mismatches(year, month):
+    db = database.SessionLocal()
+    try:
+        result = rollup.check(db, year, month)
+    finally:
+        db.close()
+    assert result["rows_checked"] > 0
+    return result["mismatches"]
+
+
+def test_incremental_rollups_match_a_recount(client):
+    # The first day creates user 1's rollup row, the next ones update it in place.
+    _manual(client, 1, "2023-03-01")
+    _manual(client, 1, "2023-03-02")
+    _manual(client, 1, "2023-03-02", check_in="10:00")
+    for day in ("2023-03-02", "2023-03-03"):
+        assert client.post("/attendance/holidays", json={"date": day, "name": "Festival"}).status_code == 201
+    _manual(client, 1, "2023-03-03")
+    # Checked before the import, which recounts user 1's month.
+    assert _mismatches(2023, 3) == []
+
+    db = database.SessionLocal()
+    try:
+        result = attendance_import.import_stream(db, attendance_import.text_stream(io.BytesIO(
+            b"user_id,timestamp\n1,2023-03-06T09:00:00\n1,2023-03-06T18:00:00\n"
+            b"2,2023-03-06T09:00:00\n2,2023-03-07T09:30:00\n"
+        )))
+    finally:
+        db.close()
+    assert result["errors"] == []
+    assert _mismatches(2023, 3) == []
+
+    for day in ("2023-03-02", "2023-03-03"):
+        assert client.post("/attendance/holidays/delete", json={"date": day, "name": "Festival"}).status_code == 200
+    assert _mismatches(2023, 3) == []
+
+    today = date.today()
+    assert client.post("/attendance/checkin", json={"user_id": 1}).status_code == 201
+    assert _mismatches(today.year, today.month) == []
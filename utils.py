@@ -1,5 +1,8 @@
 from fastapi import HTTPException
 import os,re
+import hashlib
+import uuid
+import json
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from datetime import datetime
@@ -9,16 +12,60 @@ OUTPUT_DIR = os.path.join(ROOT, "outputs", "payslips")
 if not os.path.exists(OUTPUT_DIR):
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def save_payslip_pdf(employee, payroll_row):
-    emp_code = getattr(employee, "employee_code", f"EMP{employee.id:03d}")
-    fname = f"payslip_{emp_code}_{payroll_row.period_start.isoformat()}_{payroll_row.period_end.isoformat()}.pdf"
-    path = os.path.join(OUTPUT_DIR, fname)
+# Bump whenever the payslip layout changes so cached PDFs are re-rendered.
+PAYSLIP_TEMPLATE_VERSION = "1"
 
-    
-    if os.path.exists(path):
-        return path
 
-    c = canvas.Canvas(path, pagesize=A4)
+def payslip_key(data):
+    """Content hash of a payslip: the payroll values it shows plus the template version."""
+    raw = json.dumps({**data, "template": PAYSLIP_TEMPLATE_VERSION}, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def payslip_path(employee, payroll_row, data=None):
+    data = data or payslip_data(employee, payroll_row)
+    fname = f"payslip_{data['emp_code']}_{data['period_start']}_{data['period_end']}_{payslip_key(data)}.pdf"
+    return os.path.join(OUTPUT_DIR, fname)
+
+
+def payslip_data(employee, payroll_row):
+    """Plain, picklable snapshot of what a payslip shows, so it can be rendered in another process."""
+    return {
+        "emp_code": getattr(employee, "employee_code", f"EMP{employee.id:03d}"),
+        "full_name": f"{employee.first_name} {employee.last_name}",
+        "period_start": payroll_row.period_start.isoformat(),
+        "period_end": payroll_row.period_end.isoformat(),
+        "basic_salary": float(payroll_row.basic_salary),
+        "allowances": float(payroll_row.allowances),
+        "deductions": float(payroll_row.deductions),
+        "absent_days": payroll_row.absent_days,
+        "absent_deduction": float(payroll_row.absent_deduction),
+        "total_deductions": float(payroll_row.total_deductions),
+        "net_salary": float(payroll_row.net_salary),
+    }
+
+
+def render_payslip_pdf(path, data):
+    # Render into a temp file and move it into place so readers never see a half-written PDF.
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        _draw_payslip(tmp_path, data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    try:
+        with open(os.path.join(os.path.dirname(__file__), "audit.log"), "a") as f:
+            f.write(f"{datetime.now().isoformat()} - saved payslip - {path}\n")
+    except Exception:
+        pass
+
+    return path
+
+
+def _draw_payslip(tmp_path, data):
+    c = canvas.Canvas(tmp_path, pagesize=A4)
     width, height = A4
 
     c.setFont("Helvetica-Bold", 16)
@@ -27,36 +74,35 @@ def save_payslip_pdf(employee, payroll_row):
     c.drawString(50, height - 80, "Address line 1, City - PIN")
 
     c.setFont("Helvetica-Bold", 12)
-    full_name = f"{employee.first_name} {employee.last_name}"
-    c.drawString(50, height - 120, f"Payslip for: {full_name} ({emp_code})")
+    c.drawString(50, height - 120, f"Payslip for: {data['full_name']} ({data['emp_code']})")
     c.setFont("Helvetica", 10)
-    c.drawString(50, height - 140, f"Period: {payroll_row.period_start.isoformat()} to {payroll_row.period_end.isoformat()}")
+    c.drawString(50, height - 140, f"Period: {data['period_start']} to {data['period_end']}")
 
     start_y = height - 180
     lh = 18
 
     c.setFont("Helvetica", 11)
     c.drawString(50, start_y, "Basic Salary:")
-    c.drawRightString(500, start_y, f"{payroll_row.basic_salary:,.2f}")
+    c.drawRightString(500, start_y, f"{data['basic_salary']:,.2f}")
 
     c.drawString(50, start_y - lh, "Allowances:")
-    c.drawRightString(500, start_y - lh, f"{payroll_row.allowances:,.2f}")
+    c.drawRightString(500, start_y - lh, f"{data['allowances']:,.2f}")
 
     c.drawString(50, start_y - 2*lh, "Deductions (base):")
-    c.drawRightString(500, start_y - 2*lh, f"{payroll_row.deductions:,.2f}")
+    c.drawRightString(500, start_y - 2*lh, f"{data['deductions']:,.2f}")
 
     c.drawString(50, start_y - 3*lh, "Absent days:")
-    c.drawRightString(500, start_y - 3*lh, f"{payroll_row.absent_days}")
+    c.drawRightString(500, start_y - 3*lh, f"{data['absent_days']}")
 
     c.drawString(50, start_y - 4*lh, "Absent deduction:")
-    c.drawRightString(500, start_y - 4*lh, f"{payroll_row.absent_deduction:,.2f}")
+    c.drawRightString(500, start_y - 4*lh, f"{data['absent_deduction']:,.2f}")
 
     c.drawString(50, start_y - 5*lh, "Total deductions:")
-    c.drawRightString(500, start_y - 5*lh, f"{payroll_row.total_deductions:,.2f}")
+    c.drawRightString(500, start_y - 5*lh, f"{data['total_deductions']:,.2f}")
 
     c.setFont("Helvetica-Bold", 12)
     c.drawString(50, start_y - 7*lh, "Net Salary:")
-    c.drawRightString(500, start_y - 7*lh, f"{payroll_row.net_salary:,.2f}")
+    c.drawRightString(500, start_y - 7*lh, f"{data['net_salary']:,.2f}")
 
     c.setFont("Helvetica", 9)
     c.drawString(50, 80, "This is a system generated payslip.")
@@ -64,13 +110,7 @@ def save_payslip_pdf(employee, payroll_row):
 
     c.showPage()
     c.save()
-    try:
-        with open(os.path.join(os.path.dirname(__file__), "audit.log"), "a") as f:
-            f.write(f"{datetime.now().isoformat()} - saved payslip - {path}\n")
-    except Exception:
-        pass
 
-    return path
 
 def validate_password(password: str):
     pattern = re.compile(